@@ -0,0 +1,141 @@
+"""
+PROJET DRONE - Batch missions
+
+Run missions without any prompt, from a JSONL file (one mission per line) or stdin:
+  {"id": "m1", "home": [47.275927, -1.505819], "waypoints": [[47.28, -1.50], [47.28, -1.49]], "alt": 20}
+One JSON result per mission is written as soon as it ends:
+  python batch.py missions.jsonl --workers 8 --output results.jsonl
+"""
+
+import argparse, concurrent.futures, contextlib, io, json, sys, threading, time
+
+import dronekit_wrapper
+
+
+def parse_spec(line, number):
+    """
+    Read one mission spec
+    :param line: JSON line
+    :param number: Line number, default mission id
+    :return: Spec dict with defaults
+    """
+    spec = json.loads(line)
+    home = spec["home"]
+    if len(home) < 2:
+        raise ValueError("'home' doit être [lat, lon]")
+    return {
+        "id": spec.get("id", number),
+        "home": home[:2],
+        "waypoints": spec.get("waypoints", []),
+        "alt": spec.get("alt", 20),
+        "optimize": spec.get("optimize", False),
+        "simplify": spec.get("simplify"),
+        "timeout": spec.get("timeout")
+    }
+
+def run_mission(spec, new_drone, timeout):
+    """
+    Fly one mission: takeoff, waypoints, return home and landing
+    :param spec: Spec as returned by `parse_spec`
+    :param new_drone: Function (lat, lon) returning a connected Drone
+    :param timeout: Maximum mission time in seconds (None to wait forever)
+    :return: Result dict {id, outcome, duration, distance, waypoints, ?error}
+    """
+    report = {"id": spec["id"], "outcome": "error", "duration": 0., "distance": 0., "waypoints": len(spec["waypoints"])}
+    started = time.monotonic()
+    drone = None
+    try:
+        drone = new_drone(*spec["home"])
+        drone.arm_and_takeoff(spec["alt"])
+        drone.create_mission()
+        drone.add_waypoints(spec["waypoints"])
+        drone.start_mission(spec["optimize"], spec["simplify"])
+        report["distance"] = drone.legs.total
+        timeout = spec["timeout"] or timeout
+        if not drone.wait_until(lambda: drone.has_finished, timeout):
+            report["outcome"] = "timeout"
+        else:
+            drone.land()
+            landed = drone.wait_until(lambda: (drone.location[2] or 0) <= .1, timeout and max(timeout - (time.monotonic() - started), 0))
+            report["outcome"] = "finished" if landed else "timeout"
+        # Simulated flight time
+        if hasattr(drone.vehicle, "time"): report["sim_time"] = drone.vehicle.time
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        report["duration"] = time.monotonic() - started
+        if drone is not None:
+            with contextlib.suppress(Exception):
+                drone.stop()
+    return report
+
+def read_specs(source):
+    """
+    Iterate over mission specs, invalid lines give an error result instead
+    :param source: Opened JSONL file
+    :return: Iterator of (spec, None) or (None, error result)
+    """
+    for number, line in enumerate(source, 1):
+        if not line.strip():
+            continue
+        try:
+            yield parse_spec(line, number), None
+        except (ValueError, KeyError, TypeError) as e:
+            yield None, {"id": number, "outcome": "invalid", "error": f"{type(e).__name__}: {e}"}
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Drone batch missions")
+    parser.add_argument("input", nargs="?", default="-", help="Missions JSONL file (stdin if not specified)")
+    parser.add_argument("--output", help="Results JSONL file (stdout if not specified)")
+    parser.add_argument("--backend", choices=["sim", "sitl"], default="sim", help="Vehicle flying the missions")
+    parser.add_argument("--workers", type=int, default=4, help="Missions flown in parallel")
+    parser.add_argument("--speedup", type=float, default=100, help="Simulated seconds per real second (sim backend)")
+    parser.add_argument("--timeout", type=float, help="Maximum time per mission in seconds")
+    parser.add_argument("--quiet", action="store_true", help="Hide drones messages (written to stderr otherwise)")
+    args = parser.parse_args(args)
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r")
+    output = open(args.output, "a") if args.output else sys.stdout
+    pool = None
+    if args.backend == "sitl":
+        pool = dronekit_wrapper.SITLPool(max_size=args.workers)
+        new_drone = lambda lat, lon: dronekit_wrapper.Drone(lat, lon, "127.0.0.1", pool=pool)
+    else:
+        new_drone = lambda lat, lon: dronekit_wrapper.Drone.simulated(lat, lon, args.speedup)
+
+    lock = threading.Lock()
+    outcomes = {}
+
+    def write(report):
+        with lock:
+            output.write(json.dumps(report) + "\n")
+            output.flush()
+            outcomes[report["outcome"]] = outcomes.get(report["outcome"], 0) + 1
+
+    started = time.monotonic()
+    # Drones messages would mix with results on stdout
+    with contextlib.redirect_stdout(io.StringIO() if args.quiet else sys.stderr), \
+            concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+        running = set()
+        for spec, invalid in read_specs(source):
+            if invalid is not None:
+                write(invalid)
+                continue
+            # Bounded queue, specs are read as missions end
+            if len(running) >= 2 * args.workers:
+                done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done: write(future.result())
+            running.add(executor.submit(run_mission, spec, new_drone, args.timeout))
+        for future in concurrent.futures.as_completed(running):
+            write(future.result())
+
+    if pool is not None: pool.close()
+    if source is not sys.stdin: source.close()
+    if output is not sys.stdout: output.close()
+    print(f"{sum(outcomes.values())} missions en {time.monotonic() - started:.1f}s : " + ", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items())), file=sys.stderr)
+    return 0 if set(outcomes) <= {"finished"} else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""
+PROJET DRONE - Benchmarks
+
+Measure mission, mission files, telemetry, distance, survey, geofence, configuration, gazetteer and menu hot paths
+Results are written as JSON, to be compared between versions:
+  python benchmark.py --output before.json
+  python benchmark.py --compare before.json
+"""
+
+import argparse, builtins, contextlib, io, json, os, platform, statistics, subprocess, sys, tempfile, time
+
+import dronekit_wrapper
+
+# Maximum time to import dronekit_wrapper (seconds)
+IMPORT_BUDGET = .150
+# Home location used by benchmarks (ICAM - Nantes)
+HOME = [47.275927, -1.505819]
+
+
+def timed(function, repeat=5):
+    """
+    Run a function several times
+    :param function: Function without arguments
+    :param repeat: Number of runs
+    :return: {best, median} durations in seconds
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return {"best": min(durations), "median": statistics.median(durations)}
+
+def rate(function, duration=.5):
+    """
+    Return how many times per second a function can be called
+    :param function: Function without arguments
+    :param duration: Measure duration in seconds
+    """
+    calls = 0
+    start = time.perf_counter()
+    end = start + duration
+    while time.perf_counter() < end:
+        function()
+        calls += 1
+    return calls / (time.perf_counter() - start)
+
+def result(name, value, unit, **params):
+    """
+    Format one measure
+    :param name: Measured operation
+    :param value: Measured value
+    :param unit: Value unit ("s", "calls/s", ...)
+    :param params: Measure parameters (size...)
+    """
+    return {"name": name, "params": params, "value": value, "unit": unit}
+
+def key(entry):
+    """
+    Return a measure identifier, same for the same operation and parameters between runs
+    """
+    return entry["name"] + "".join(f" {k}={v}" for k, v in sorted(entry["params"].items()))
+
+def log(message):
+    print(message, file=sys.stderr)
+
+
+def bench_import():
+    """
+    Time to import dronekit_wrapper in a new interpreter
+    """
+    code = "import time; t = time.perf_counter(); import dronekit_wrapper; print(time.perf_counter() - t)"
+    durations = [float(subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout) for _ in range(5)]
+    yield result("import", min(durations), "s", budget=IMPORT_BUDGET)
+
+def bench_mission(new_drone, sizes):
+    """
+    Mission creation, waypoints addition and upload
+    """
+    for size in sizes:
+        drone = new_drone()
+        try:
+            points = [[HOME[0] + .001 * (i % 100), HOME[1] + .001 * (i // 100)] for i in range(size)]
+
+            def build():
+                drone.create_mission()
+                for lat, lon in points:
+                    drone.add_waypoint(lat, lon)
+            yield result("mission.add_waypoint", timed(build)["median"], "s", size=size)
+
+            def build_bulk():
+                drone.create_mission()
+                drone.add_waypoints(points)
+            yield result("mission.add_waypoints", timed(build_bulk)["median"], "s", size=size)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                drone.arm_and_takeoff(10)
+                start = time.perf_counter()
+                drone.start_mission()
+                yield result("mission.start_mission", time.perf_counter() - start, "s", size=size)
+                drone.mission.items["z"][size // 2] += 1
+                yield result("mission.upload_incremental", drone.upload_mission()["time"], "s", size=size)
+                yield result("mission.upload_full", drone.upload_mission(incremental=False)["time"], "s", size=size)
+        finally:
+            with contextlib.redirect_stdout(io.StringIO()):
+                drone.stop()
+
+def bench_mission_files(sizes):
+    """
+    Mission files export and import throughput (QGC WPL 110 text and binary)
+    """
+    import numpy as np
+    mission = dronekit_wrapper.Mission()
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            mission.clear()
+            mission.add_waypoints(np.column_stack((HOME[0] + np.arange(size) * 1e-5, np.full(size, HOME[1]))), 20)
+            for fmt in ["qgc", "binary"]:
+                path = os.path.join(directory, f"mission_{size}.{fmt}")
+                write = timed(lambda: dronekit_wrapper.write_mission_file(path, mission.items, HOME, fmt))["median"]
+                yield result("mission_file.write", size / write, "items/s", size=size, format=fmt)
+                read = timed(lambda: sum(len(items) for items in dronekit_wrapper.read_mission_file(path)))["median"]
+                yield result("mission_file.read", size / read, "items/s", size=size, format=fmt)
+
+def bench_telemetry(new_drone):
+    """
+    Telemetry properties call rates and MAVLink link traffic
+    """
+    drone = new_drone()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            drone.arm_and_takeoff(10)
+            drone.create_mission()
+            drone.add_waypoints([[HOME[0] + .01, HOME[1]], [HOME[0], HOME[1] + .01]])
+            drone.start_mission()
+        yield result("telemetry.home_distance", rate(lambda: drone.home_distance), "calls/s")
+        yield result("telemetry.waypoint_distance", rate(lambda: drone.waypoint_distance), "calls/s")
+        yield result("telemetry.location", rate(lambda: drone.location), "calls/s")
+        yield result("telemetry.remaining_distance", rate(lambda: drone.remaining_distance), "calls/s")
+        yield result("telemetry.eta", rate(lambda: drone.eta), "calls/s")
+        # MAVLink traffic, only measurable on a real link (SITL backend)
+        if hasattr(drone.vehicle, "message_factory"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                link = drone.set_stream_rates({"MAV_DATA_STREAM_ALL": 0, "MAV_DATA_STREAM_POSITION": 10}, measure=2)
+            yield result("link.bytes", link["before"]["bytes"], "bytes/s", streams="default")
+            yield result("link.bytes", link["after"]["bytes"], "bytes/s", streams="position")
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            drone.stop()
+
+def bench_pool():
+    """
+    Time from Drone() to ready, with a new simulator and with a warm one from a SITLPool (SITL backend only)
+    """
+    with dronekit_wrapper.SITLPool() as pool, contextlib.redirect_stdout(io.StringIO()):
+        for state in ["cold", "warm"]:
+            start = time.perf_counter()
+            drone = dronekit_wrapper.Drone(*HOME, "127.0.0.1", pool=pool)
+            yield result("drone.connect", time.perf_counter() - start, "s", sitl=state)
+            pool.release(drone._port, drone.sitl, drone.vehicle, wait=True)
+            drone.events.close()
+
+def bench_distances(sizes):
+    """
+    Vectorized distances, path simplification and route optimization
+    """
+    import numpy as np
+    generator = np.random.default_rng(0)
+    for size in sizes:
+        points = np.column_stack((HOME[0] + generator.random(size) * .1, HOME[1] + generator.random(size) * .1))
+        for mode in ["haversine", "equirectangular"]:
+            yield result("distances", timed(lambda: dronekit_wrapper.distances(HOME, points, mode))["median"], "s", size=size, mode=mode)
+        # Noisy track along a curve, simplified to 2m
+        t = np.linspace(0, 1, size)
+        track = np.column_stack((HOME[0] + .02 * t + generator.normal(0, 2e-6, size), HOME[1] + .01 * np.sin(6 * t)))
+        for method in dronekit_wrapper.SIMPLIFY_METHODS:
+            yield result("simplify_path", timed(lambda: dronekit_wrapper.simplify_path(track, 2, method))["median"], "s", size=size, method=method)
+        if size <= 2000:
+            yield result("distance_matrix", timed(lambda: dronekit_wrapper.distance_matrix(points))["median"], "s", size=size)
+        if size <= 500:
+            yield result("optimize_route", timed(lambda: dronekit_wrapper.optimize_route(points, HOME), 1)["median"], "s", size=size)
+
+def bench_survey(sizes):
+    """
+    Survey grid generation and loading into a mission, grid spacing chosen to get about `size` waypoints
+    """
+    # 1km x 1km square
+    area = [HOME, [HOME[0] + .009, HOME[1]], [HOME[0] + .009, HOME[1] + .0132], [HOME[0], HOME[1] + .0132]]
+    mission = dronekit_wrapper.Mission()
+    for size in sizes:
+        spacing = step = 1000 / size ** .5
+
+        def survey():
+            mission.clear()
+            mission.add_waypoints(dronekit_wrapper.survey_pattern(area, spacing, 30, step), 30)
+        yield result("survey", timed(survey)["median"], "s", size=size)
+
+def bench_geofence(sizes, zones=300):
+    """
+    Mission legs check against many small no-fly zones
+    """
+    import numpy as np
+    generator = np.random.default_rng(0)
+    corners = generator.random((zones, 2)) * .5 + HOME
+    square = np.array([[0, 0], [.005, 0], [.005, .005], [0, .005]])
+    fence = dronekit_wrapper.Geofence([(None, [corner + square]) for corner in corners])
+    for size in sizes:
+        path = np.cumsum(np.vstack(([[HOME[0] + .25, HOME[1] + .25]], generator.normal(0, .003, (size, 2)))), axis=0)
+        yield result("geofence.check", timed(lambda: fence.check(path))["median"], "s", size=size, zones=zones)
+
+def bench_config(sizes):
+    """
+    JSONFile load and save with growing history
+    """
+    import main
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = os.path.join(directory, f"config_{size}.json")
+            history = [[f"Adresse {i}", [HOME[0] + i * 1e-4, HOME[1]]] for i in range(size)]
+            with open(path, "w") as f:
+                json.dump({"location": {"saved": [], "history": history}, "config": {"max_history": size}}, f)
+            yield result("config.load", timed(lambda: main.JSONFile(path))["median"], "s", size=size)
+            config = main.JSONFile(path)
+            yield result("config.save", timed(config.save)["median"], "s", size=size)
+            journal = main.JSONFile(path, journal=True, debounce=0)
+
+            def save_journal():
+                journal["location.history"] = journal["location.history"][:size]
+                journal.save()
+            yield result("config.save_journal", timed(save_journal)["median"], "s", size=size)
+            journal.close()
+
+def bench_gazetteer(sizes):
+    """
+    Offline gazetteer index build, first lookup (index mapping included) and autocompletion
+    """
+    import main
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = os.path.join(directory, f"gazetteer_{size}.csv")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("name,lat,lon,country\n")
+                f.writelines(f"Lieu {i},{HOME[0] + i * 1e-5},{HOME[1]},FR\n" for i in range(size))
+            yield result("gazetteer.build", timed(main.Gazetteer(path).build, 1)["median"], "s", size=size)
+
+            def first_lookup():
+                gazetteer = main.Gazetteer(path)
+                gazetteer.lookup(f"lieu {size // 2}")
+                gazetteer.close()
+            yield result("gazetteer.first_lookup", timed(first_lookup)["median"], "s", size=size)
+            gazetteer = main.Gazetteer(path)
+            yield result("gazetteer.complete", rate(lambda: gazetteer.complete("lieu 1")), "calls/s", size=size)
+            gazetteer.close()
+
+def bench_menu(sizes):
+    """
+    pick_choice rendering with large lists (input answered automatically)
+    """
+    import main
+    for size in sizes:
+        choices = [f"Adresse {i:<40} (47.000, -1.000)" for i in range(size)]
+
+        def pick():
+            with contextlib.redirect_stdout(io.StringIO()):
+                main.pick_choice("Choix", ["", ["Localisation automatique", "Entrée manuelle"]], ["Historique", choices])
+        answer, builtins.input = builtins.input, lambda *_: "1"
+        try:
+            yield result("menu.pick_choice", timed(pick)["median"], "s", size=size)
+        finally:
+            builtins.input = answer
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Drone benchmarks")
+    parser.add_argument("--backend", choices=["sim", "sitl"], default="sim", help="Vehicle used by mission and telemetry benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes")
+    parser.add_argument("--output", help="Results JSON file (stdout if not specified)")
+    parser.add_argument("--compare", help="Previous results JSON file to compare with")
+    args = parser.parse_args(args)
+
+    if args.backend == "sitl":
+        new_drone = lambda: dronekit_wrapper.Drone(*HOME, "127.0.0.1")
+    else:
+        new_drone = lambda: dronekit_wrapper.Drone.simulated(*HOME)
+    mission_sizes = [10, 100, 1000] if args.quick else [10, 100, 1000, 5000]
+    sizes = [10, 100, 1000] if args.quick else [10, 100, 1000, 10000]
+
+    results = []
+    benchmarks = [
+        ("import", bench_import()),
+        ("mission", bench_mission(new_drone, mission_sizes)),
+        ("mission_files", bench_mission_files(sizes)),
+        ("telemetry", bench_telemetry(new_drone)),
+        ("distances", bench_distances(sizes)),
+        ("survey", bench_survey(sizes)),
+        ("geofence", bench_geofence(sizes)),
+        ("config", bench_config(sizes)),
+        ("gazetteer", bench_gazetteer(sizes)),
+        ("menu", bench_menu(sizes))
+    ]
+    if args.backend == "sitl":
+        benchmarks.insert(1, ("pool", bench_pool()))
+    for name, benchmark in benchmarks:
+        log(f"Benchmark '{name}'...")
+        results.extend(benchmark)
+
+    report = {
+        "meta": {"time": time.time(), "python": platform.python_version(), "platform": platform.platform(), "backend": args.backend},
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {key(entry): entry for entry in json.load(f)["results"]}
+        for entry in results:
+            before = previous.get(key(entry))
+            if before and before["value"]:
+                log(f"{key(entry):<55} {before['value']:>12.6g} -> {entry['value']:>12.6g} {entry['unit']:<8} (x{entry['value'] / before['value']:.2f})")
+
+    # Import time budget
+    imported = next(entry for entry in results if entry["name"] == "import")
+    if imported["value"] > IMPORT_BUDGET:
+        log(f"\33[31mImport de dronekit_wrapper trop lent : {imported['value'] * 1000:.0f}ms > {IMPORT_BUDGET * 1000:.0f}ms\33[0m")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
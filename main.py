@@ -4,10 +4,13 @@ PROJET DRONE
 Python 3.8
 """
 
-import math, json, time, os
+import atexit, csv, math, mmap, json, struct, time, os, sqlite3, threading, unicodedata
 
-# Enable color in console
-os.system("color")
+# Place names completion while typing, not available on Windows
+try:
+    import readline
+except ImportError:
+    readline = None
 
 # pathdict is mandatory for script to run, auto install later on
 # geocoder is mandatory for script to run, auto install later on
@@ -17,6 +20,9 @@ os.system("color")
 # pymavlink is mandatory for script to run, auto install later on
 import dronekit_wrapper
 
+# Enable color in console
+dronekit_wrapper.enable_color()
+
 """
 Import pathdict
 
@@ -114,25 +120,167 @@ def pick_choice(request, *sections, empty_section=False):
             }
         # Else restart loop
 
+# Locations closer than this distance (m) are the same place in history
+HISTORY_DEDUPE_RADIUS = 50
+
+class LocationIndex:
+    """
+    Grid spatial index of locations, for nearest and radius queries
+    Locations are bucketed in `cell` degrees square cells, queries only look at neighbouring cells
+    """
+    def __init__(self, cell=.005):
+        """
+        :param cell: Cell size in degrees (.005 is about 500m)
+        """
+        self.cell = cell
+        self._cells = {}
+        self._locations = {}
+
+    def __len__(self):
+        return len(self._locations)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell), math.floor(lon / self.cell)
+
+    @staticmethod
+    def distance(lat1, lon1, lat2, lon2):
+        """
+        Return the great circle distance in metres between two points
+        """
+        lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+        h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        return 2 * dronekit_wrapper.EARTH_RADIUS * math.asin(math.sqrt(min(h, 1)))
+
+    def add(self, key, lat, lon):
+        """
+        Add (or move) a location
+        :param key: Location identifier
+        :param lat: Latitude
+        :param lon: Longitude
+        """
+        self.remove(key)
+        self._locations[key] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), set()).add(key)
+
+    def remove(self, key):
+        """
+        Remove a location if indexed
+        :param key: Location identifier
+        """
+        if key in self._locations:
+            cell = self._cell(*self._locations.pop(key))
+            self._cells[cell].discard(key)
+            if not self._cells[cell]: del self._cells[cell]
+
+    def clear(self):
+        self._cells = {}
+        self._locations = {}
+
+    def _metres_per_cell(self, lat):
+        """
+        Return the smallest cell side in metres around a latitude
+        """
+        return self.cell * math.radians(1) * dronekit_wrapper.EARTH_RADIUS * math.cos(math.radians(min(abs(lat) + self.cell, 89.9)))
+
+    def within(self, lat, lon, radius):
+        """
+        Return locations closer than `radius` metres, nearest first
+        :param lat: Latitude
+        :param lon: Longitude
+        :param radius: Distance in metres
+        :return: list<(distance, key)>
+        """
+        ci, cj = self._cell(lat, lon)
+        span = math.ceil(radius / self._metres_per_cell(lat))
+        if (2 * span + 1) ** 2 < len(self._cells):
+            cells = [(ci + i, cj + j) for i in range(-span, span + 1) for j in range(-span, span + 1)]
+        else:
+            cells = [cell for cell in self._cells if abs(cell[0] - ci) <= span and abs(cell[1] - cj) <= span]
+        found = []
+        for cell in cells:
+            for key in self._cells.get(cell, ()):
+                distance = self.distance(lat, lon, *self._locations[key])
+                if distance <= radius:
+                    found.append((distance, key))
+        return sorted(found)
+
+    def nearest(self, lat, lon, k=1):
+        """
+        Return the `k` nearest locations, looking at rings of cells around the point until no closer one can exist
+        :param lat: Latitude
+        :param lon: Longitude
+        :param k: Number of locations
+        :return: list<(distance, key)>, nearest first
+        """
+        if not self._cells:
+            return []
+        ci, cj = self._cell(lat, lon)
+        side = self._metres_per_cell(lat)
+        found = []
+        ring = 0
+        while (2 * ring + 1) ** 2 <= len(self._cells):
+            if ring == 0:
+                cells = [(ci, cj)]
+            else:
+                cells = [(ci + i, cj + j) for i in range(-ring, ring + 1) for j in (-ring, ring)]
+                cells += [(ci + i, cj + j) for i in (-ring, ring) for j in range(-ring + 1, ring)]
+            for cell in cells:
+                for key in self._cells.get(cell, ()):
+                    found.append((self.distance(lat, lon, *self._locations[key]), key))
+            found = sorted(found)[:k]
+            # Locations outside scanned rings are at least `ring * side` away
+            if len(found) == min(k, len(self._locations)) and found[-1][0] <= ring * side:
+                return found
+            ring += 1
+        # Far from every location, rings would hold more empty cells than there are locations
+        return sorted((self.distance(lat, lon, *location), key) for key, location in self._locations.items())[:k]
+
 class JSONFile:
     """
     JSON File object
     Make json file management and edition easier
+
+    Journal mode: values set with `file[path] = value` are appended to `<path>.journal` instead of rewriting
+    the whole file, saves within `debounce` seconds are written together, and the journal is merged into the
+    file every `compact_every` entries and on exit. In-place edits (list.append...) must be assigned back to be saved.
     """
-    def __init__(self, path):
+    def __init__(self, path, journal=False, debounce=1.0, compact_every=100):
+        """
+        :param path: JSON file path
+        :param journal: Enable journal mode
+        :param debounce: Journal mode, seconds to wait for other changes before writing
+        :param compact_every: Journal mode, journal entries before merging them into the file
+        """
         self._path = path
+        self._journal = journal
+        self.debounce = debounce
+        self.compact_every = compact_every
+        self._pending = {}
+        self._indexes = {}
+        self._journal_entries = 0
+        self._timer = None
+        self._lock = threading.RLock()
         self._content = pathdict.PathDict({})
         self._open()
         self.refresh = self._open
         self.get = self.__getitem__
         self.set = self.__setitem__
+        if journal: atexit.register(self.close)
 
     @property
     def path(self): return self._path
 
+    @property
+    def journal_path(self): return f"{self._path}.journal"
+
+    @staticmethod
+    def _dumps(data, **kwargs):
+        return json.dumps(data, default=lambda x: x.data if isinstance(x, (pathdict.PathDict, pathdict.collection.StringIndexableList)) else x, **kwargs)
+
     def _open(self):
         """
         Open the file, create it if not existing
+        In journal mode, journal entries are applied on top of the file
         """
         if not os.path.exists(self._path):
             print(f"Configuration file '{self._path}' is missing and has to be created")
@@ -154,35 +302,483 @@ class JSONFile:
                     print("Une erreur s'est produite, les valeurs par défaut vont être utilisées")
             if self._content.data == {}:
                 self._content = pathdict.PathDict({"location":{"saved": [],"history": []},"config": {"max_history": 5}})
-            self.save()
+            self._write_snapshot()
             print(f"Fichier '{self._path}' créé")
         with open(self._path, "r") as f:
             self._content = pathdict.PathDict(json.load(f), create_if_not_exists=True)
+        self._indexes = {}
+        self._journal_entries = 0
+        if self._journal and os.path.exists(self.journal_path):
+            truncated = False
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    # noinspection PyBroadException
+                    try:
+                        entry = json.loads(line)
+                    except Exception:
+                        # Last line cut by a crash
+                        truncated = True
+                        break
+                    self._content[entry["path"]] = entry["value"]
+                    self._journal_entries += 1
+            # Start a clean journal, next entries must not follow the cut line
+            if truncated: self.compact()
+
+    def _write_snapshot(self):
+        """
+        Write the whole file atomically (temporary file renamed over the previous one)
+        """
+        tmp = f"{self._path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self._dumps(self._content.data, indent=2))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path)
 
     def save(self):
         """
         Save the file
+        In journal mode, changes are appended to the journal once `debounce` seconds passed
+        """
+        if not self._journal:
+            self._write_snapshot()
+            return
+        with self._lock:
+            if self.debounce <= 0:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.debounce, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
         """
-        with open(self._path, "w+") as f:
-            json.dump(self._content.data, f, default=lambda x: x.data if isinstance(x, (pathdict.PathDict, pathdict.collection.StringIndexableList)) else x, indent=2)
+        Journal mode, write pending changes now
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            with open(self.journal_path, "a") as f:
+                for path, value in self._pending.items():
+                    f.write(self._dumps({"path": path, "value": value}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_entries += len(self._pending)
+            self._pending = {}
+            if self._journal_entries >= self.compact_every:
+                self.compact()
+
+    def compact(self):
+        """
+        Journal mode, merge the journal into the file
+        """
+        with self._lock:
+            self._write_snapshot()
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self._journal_entries = 0
+
+    def close(self):
+        """
+        Journal mode, write pending changes and merge the journal into the file
+        """
+        if self._journal:
+            # Closed files are not kept alive until exit
+            atexit.unregister(self.close)
+            self.flush()
+            if self._journal_entries:
+                self.compact()
+
+    def index(self, path):
+        """
+        Return the spatial index of a locations list (list<[name, [lat, lon]]>), kept up to date on assignment
+        Index keys are positions in the list
+        :param path: Locations list path ("location.saved", "location.history")
+        :return: LocationIndex
+        """
+        if path not in self._indexes:
+            index = LocationIndex()
+            for i, (_, (lat, lon)) in enumerate(self._content[path]):
+                index.add(i, lat, lon)
+            self._indexes[path] = index
+        return self._indexes[path]
 
     def __getitem__(self, item):
         return self._content[item]
 
     def __setitem__(self, key, value):
-        self._content[key] = value
+        with self._lock:
+            self._content[key] = value
+            if self._journal: self._pending[key] = value
+            # Rebuilt on next use
+            self._indexes.pop(key, None)
+
+
+class CachedGeo:
+    """
+    Geolocation restored from `GeoCache`
+    Same attributes as the geocoder results used by this script
+    """
+    ok = True
 
+    def __init__(self, fields):
+        self.__dict__.update(fields)
 
+class GeoCache:
+    """
+    Geocoding results cache stored in a SQLite file
+    Entries expire after `ttl` seconds, least recently used ones are removed above `max_entries`
+    Expired entries are still used when the network is unavailable
+    """
+    FIELDS = ["latlng", "street", "city", "town", "village", "municipality", "district", "neighborhood", "quarter", "country"]
+
+    def __init__(self, path, ttl=30 * 24 * 3600, max_entries=10000):
+        """
+        Open the cache, create it if not existing
+        :param path: SQLite file path
+        :param ttl: Entry lifetime in seconds
+        :param max_entries: Maximum number of entries
+        """
+        self._path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = self.misses = self.stale = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS geocache (key TEXT PRIMARY KEY, fields TEXT, created REAL, accessed REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS geocache_accessed ON geocache (accessed)")
+        self._db.commit()
+
+    @property
+    def path(self): return self._path
+
+    @property
+    def stats(self):
+        """
+        Return cache counters
+        :return: {entries, hits, misses, stale}
+        """
+        return {
+            "entries": self._db.execute("SELECT COUNT(*) FROM geocache").fetchone()[0],
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale
+        }
+
+    @staticmethod
+    def normalize(query):
+        """
+        Return the cache key part of a query: lowercase, without accents, punctuation spacing and extra spaces
+        :param query: Address
+        :return: Normalized address
+        """
+        query = unicodedata.normalize("NFKD", query.casefold())
+        query = "".join(c for c in query if not unicodedata.combining(c))
+        return " ".join(query.replace(",", " ").split())
+
+    def get(self, kind, query, ttl=None, stale=False):
+        """
+        Return a cached geolocation
+        :param kind: Geocoding service ("osm", "ipinfo", ...)
+        :param query: Address
+        :param ttl: Entry lifetime in seconds (cache one if not specified)
+        :param stale: Return expired entries too
+        :return: CachedGeo, None if missing or expired
+        """
+        key = f"{kind}:{self.normalize(query)}"
+        row = self._db.execute("SELECT fields, created FROM geocache WHERE key = ?", (key,)).fetchone()
+        if row is None or (not stale and time.time() - row[1] > (self.ttl if ttl is None else ttl)):
+            return
+        self._db.execute("UPDATE geocache SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return CachedGeo(json.loads(row[0]))
+
+    def put(self, kind, query, geo):
+        """
+        Store a geolocation, remove least recently used entries if the cache is full
+        :param kind: Geocoding service ("osm", "ipinfo", ...)
+        :param query: Address
+        :param geo: Geolocation found
+        """
+        now = time.time()
+        fields = json.dumps({field: getattr(geo, field, None) for field in self.FIELDS})
+        self._db.execute("REPLACE INTO geocache VALUES (?, ?, ?, ?)", (f"{kind}:{self.normalize(query)}", fields, now, now))
+        self._db.execute("DELETE FROM geocache WHERE key IN (SELECT key FROM geocache ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        self._db.commit()
+
+    def lookup(self, kind, query, fetch, ttl=None):
+        """
+        Return a cached geolocation, or fetch and store it
+        :param kind: Geocoding service ("osm", "ipinfo", ...)
+        :param query: Address
+        :param fetch: Function without arguments doing the network request
+        :param ttl: Entry lifetime in seconds (cache one if not specified)
+        :return: Geolocation (fetch result if not found)
+        """
+        geo = self.get(kind, query, ttl)
+        if geo is not None:
+            self.hits += 1
+            return geo
+        self.misses += 1
+        # noinspection PyBroadException
+        try:
+            geo = fetch()
+        except Exception:
+            geo = None
+        if geo is not None and geo.ok:
+            self.put(kind, query, geo)
+            return geo
+        # Network unavailable or address not found, fall back on an expired entry
+        cached = self.get(kind, query, stale=True)
+        if cached is not None:
+            self.stale += 1
+            return cached
+        return geo
+
+    def close(self):
+        """
+        Close the cache file
+        """
+        self._db.close()
+
+
+class Gazetteer:
+    """
+    Offline place names lookup and autocompletion from a local gazetteer file
+    Source: CSV with a header (name, lat/latitude, lon/lng/longitude, ?country) or GeoNames dump (tab separated, no header)
+    Normalized names are sorted in a binary index built once next to the source, then memory-mapped on first use:
+    opening is immediate whatever the size, lookups and completions are binary searches
+    Index layout: magic, count (uint64), records offsets (count + 1 x uint64), [lat, lon] (count x 2 float64),
+    then records "key\tname\tcountry" (UTF-8)
+    """
+    MAGIC = b"GAZIDX01"
+
+    def __init__(self, path, index_path=None):
+        """
+        :param path: Gazetteer source file path
+        :param index_path: Index file path (source path + ".idx" if not specified)
+        """
+        self.path = path
+        self.index_path = index_path or path + ".idx"
+        self.count = 0
+        self._file = self._map = None
+
+    def __len__(self):
+        self._open()
+        return self.count
+
+    @staticmethod
+    def normalize(name):
+        """
+        Return the index key of a place name: `GeoCache.normalize`, hyphens and apostrophes as spaces
+        """
+        return GeoCache.normalize(name.replace("-", " ").replace("'", " ").replace("’", " "))
+
+    @staticmethod
+    def _columns(path, first):
+        """
+        Return the source format from its first line: None for a GeoNames dump, else (delimiter, name, lat, lon, country)
+        columns of the CSV header. Raise ValueError if name, lat or lon is missing
+        """
+        fields = first.split("\t")
+        if len(fields) > 8 and fields[0].strip().isdigit():
+            return None
+        delimiter = "\t" if "\t" in first else ","
+        columns = {column.strip().lower(): column for column in next(csv.reader([first], delimiter=delimiter), [])}
+        name, lat, lon, country = (next((columns[c] for c in names if c in columns), None) for names in [
+            ["name"], ["lat", "latitude"], ["lon", "lng", "longitude"], ["country", "country_code"]
+        ])
+        if None in (name, lat, lon):
+            raise ValueError(f"'{path}' : colonnes name, lat et lon attendues")
+        return delimiter, name, lat, lon, country
+
+    def check(self):
+        """
+        Check the source format from its first line only, the index is built on first lookup
+        Raise ValueError if the format is not understood
+        """
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8", newline="") as f:
+                self._columns(self.path, f.readline())
+
+    @classmethod
+    def _rows(cls, path):
+        """
+        Iterate over source entries as (name, lat, lon, country)
+        """
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            columns = cls._columns(path, f.readline())
+            f.seek(0)
+            if columns is None:
+                # GeoNames: id, name, ascii name, alternate names, latitude, longitude, class, code, country code, ...
+                for row in csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE):
+                    try:
+                        yield row[1], float(row[4]), float(row[5]), row[8]
+                    except (IndexError, ValueError):
+                        continue
+                return
+            delimiter, name, lat, lon, country = columns
+            for row in csv.DictReader(f, delimiter=delimiter):
+                try:
+                    yield row[name], float(row[lat]), float(row[lon]), row[country] if country else ""
+                except (TypeError, ValueError):
+                    continue
+
+    def build(self):
+        """
+        Build the index file from the source
+        :return: Number of entries
+        """
+        entries = sorted(
+            (self.normalize(name).encode(), f"{name}\t{country}".encode(), lat, lon)
+            for name, lat, lon, country in self._rows(self.path) if name.strip()
+        )
+        offsets, position = [0], 0
+        for key, display, _, _ in entries:
+            position += len(key) + 1 + len(display)
+            offsets.append(position)
+        temp = self.index_path + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(self.MAGIC + struct.pack("<Q", len(entries)))
+            f.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+            f.write(struct.pack(f"<{2 * len(entries)}d", *(value for entry in entries for value in entry[2:])))
+            f.writelines(key + b"\t" + display for key, display, _, _ in entries)
+        os.replace(temp, self.index_path)
+        if not entries: print(f"\33[33m[!] Aucun lieu lu dans '{self.path}', vérifiez son format\33[0m")
+        return len(entries)
+
+    def _open(self):
+        """
+        Map the index, (re)build it first if missing or older than the source
+        """
+        if self._map is not None:
+            return
+        if os.path.exists(self.path) and (not os.path.exists(self.index_path) or os.path.getmtime(self.index_path) < os.path.getmtime(self.path)):
+            self.build()
+        self._file = open(self.index_path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(self.MAGIC)] != self.MAGIC:
+            self.close()
+            raise ValueError(f"'{self.index_path}' n'est pas un index de lieux")
+        self.count, = struct.unpack_from("<Q", self._map, len(self.MAGIC))
+        self._coords = len(self.MAGIC) + 8 * (self.count + 2)
+        self._records = self._coords + 16 * self.count
+
+    def _record(self, i):
+        start, end = struct.unpack_from("<2Q", self._map, len(self.MAGIC) + 8 * (i + 1))
+        return self._map[self._records + start:self._records + end]
+
+    def _key(self, i):
+        return self._record(i).split(b"\t", 1)[0]
+
+    def _search(self, key):
+        """
+        Return the index of the first entry not lower than `key`
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _geo(self, i):
+        """
+        Return entry `i` as a geolocation
+        """
+        _, name, country = self._record(i).decode().split("\t")
+        fields = dict.fromkeys(GeoCache.FIELDS)
+        fields.update(latlng=list(struct.unpack_from("<2d", self._map, self._coords + 16 * i)), city=name, country=country)
+        return CachedGeo(fields)
+
+    def complete(self, prefix, limit=10):
+        """
+        Return places whose name starts with `prefix` (case, accents and hyphens ignored)
+        :param prefix: Beginning of a place name
+        :param limit: Maximum number of places
+        :return: list<CachedGeo>
+        """
+        self._open()
+        key = self.normalize(prefix).encode()
+        places = []
+        i = self._search(key)
+        while i < self.count and len(places) < limit and self._key(i).startswith(key):
+            places.append(self._geo(i))
+            i += 1
+        return places
+
+    def lookup(self, name):
+        """
+        Return the place with exactly this name (case, accents and hyphens ignored)
+        :param name: Place name
+        :return: CachedGeo, None if not found
+        """
+        self._open()
+        key = self.normalize(name).encode()
+        i = self._search(key)
+        if i < self.count and self._key(i) == key:
+            return self._geo(i)
+
+    def close(self):
+        """
+        Unmap the index
+        """
+        if self._map is not None: self._map.close()
+        if self._file is not None: self._file.close()
+        self._file = self._map = None
+
+
+geocache = None
+# Offline place names, used before OpenStreetMap when loaded
+gazetteer = None
+
+def input_address(prompt):
+    """
+    Ask an address, names of the offline `gazetteer` places are completed with Tab while typing (needs readline)
+    :param prompt: Text shown before the input
+    :return: Typed address
+    """
+    if readline is None or gazetteer is None:
+        return input(prompt)
+    matches = []
+
+    def complete(text, state):
+        if state == 0:
+            matches[:] = dict.fromkeys(place.city for place in gazetteer.complete(text, 50)) if text.strip() else []
+        return matches[state] if state < len(matches) else None
+
+    readline.parse_and_bind("bind ^I rl_complete" if "libedit" in (readline.__doc__ or "") else "tab: complete")
+    previous = readline.get_completer(), readline.get_completer_delims()
+    readline.set_completer(complete)
+    # Whole line completed, place names have spaces
+    readline.set_completer_delims("")
+    try:
+        return input(prompt)
+    finally:
+        readline.set_completer(previous[0])
+        readline.set_completer_delims(previous[1])
 
 def get_address(address, log=False):
     """
     Return geolocation object if address found
+    Looked up in the offline `gazetteer` (exact place name), then in `geocache`, when they are loaded
     :param address:
     :param log:
     :return:
     """
-    g = geocoder.osm(address)
-    if g.ok:
+    if gazetteer is not None:
+        g = gazetteer.lookup(address)
+        if g is not None:
+            return g
+    if geocache is not None:
+        g = geocache.lookup("osm", address, lambda: geocoder.osm(address))
+    else:
+        g = geocoder.osm(address)
+    if g is not None and g.ok:
         return g
     else:
         if log: print(f"\33[33m[!] L'adresse '{address}' n'a pas été trouvé\33[0m")
@@ -238,19 +834,23 @@ def ask_geo(request_title):
         :param name: Friendly name
         :param loc: Location
         """
-        # print(name)
-        # Already in historic ?
-        loc_names = [x[0] for x in config["location.history"]]
-        if name in loc_names:
-            # True, remove older to then add a new one on top
-            config["location.history"].remove([name, loc])
-        # Add on top
-        config["location.history"].insert(0, [name, loc])
-        # If too many elements, remove the older one
-        if len(config["location.history"]) > config["config.max_history"]:
-            config["location.history"] = config["location.history"][:config["config.max_history"]]
+        # Already in historic (same name or same place) ? Remove older to then add a new one on top
+        nearby = {i for _, i in config.index("location.history").within(*loc, HISTORY_DEDUPE_RADIUS)}
+        history = [entry for i, entry in enumerate(config["location.history"]) if entry[0] != name and i not in nearby]
+        # If too many elements, remove the older one (list assigned back to be journaled)
+        config["location.history"] = [[name, loc], *history][:config["config.max_history"]]
         config.save()
 
+    def print_nearest_saved(loc):
+        """
+        Tell if a saved address is at the same place
+        :param loc: Location
+        """
+        nearest = config.index("location.saved").nearest(*loc)
+        if nearest and nearest[0][0] <= HISTORY_DEDUPE_RADIUS:
+            distance, i = nearest[0]
+            print(f"\33[33m[i] Adresse sauvegardée à {distance:.0f}m : {config['location.saved'][i][0]}\33[0m")
+
     # Get all saved addresses and ask user
     while True:
         addr_saved = config[f"location.saved"]
@@ -263,14 +863,23 @@ def ask_geo(request_title):
         )
 
         if choice["global_i"] == 0: # Auto-location
-            g = geocoder.ipinfo()
+            g = geocache.lookup("ipinfo", "", geocoder.ipinfo, ttl=3600) if geocache is not None else geocoder.ipinfo()
+            print_nearest_saved(g.latlng)
             if y_n_choices(f"Choisir cette adresse ? {get_location_name(g)} ({','.join(map('{:^8.3f}'.format, g.latlng))}) [{generate_gmaps_link(g)}"):
                 save_historic(get_location_name(g), g.latlng)
                 return g.latlng
         if choice["global_i"] == 1: # Manual entry
             while True:
-                g = get_address(input("Adresse\n>>> "), True)
+                address = input_address("Adresse\n>>> ")
+                # Offline suggestions, for incomplete or ambiguous names
+                places = gazetteer.complete(address, 9) if gazetteer is not None and address.strip() else []
+                if places and not (len(places) == 1 and Gazetteer.normalize(places[0].city) == Gazetteer.normalize(address)):
+                    suggestion = pick_choice("Lieux connus", ["", [f"{place.city} - {place.country} ({','.join(map('{:^8.3f}'.format, place.latlng))})" for place in places] + ["Rechercher en ligne"]])
+                    g = places[suggestion["index"]] if suggestion["index"] < len(places) else get_address(address, True)
+                else:
+                    g = get_address(address, True)
                 if g:
+                    print_nearest_saved(g.latlng)
                     if y_n_choices(f"Choisir cette adresse ? {get_location_name(g)} ({','.join(map('{:^8.3f}'.format, g.latlng))}) [{generate_gmaps_link(g)}]"):
                         save_historic(get_location_name(g), g.latlng)
                         return g.latlng
@@ -281,7 +890,16 @@ def ask_geo(request_title):
 
 if __name__ == '__main__':
     # Load config file
-    config = JSONFile("config.json")
+    config = JSONFile("config.json", journal=True)
+    geocache = GeoCache("geocache.db")
+    if os.path.exists("gazetteer.csv") or os.path.exists("gazetteer.csv.idx"):
+        gazetteer = Gazetteer("gazetteer.csv")
+        try:
+            # First line only, the index is built on the first typed address
+            gazetteer.check()
+        except ValueError as e:
+            print(f"\33[33m[!] Lieux hors ligne désactivés : {e}\33[0m")
+            gazetteer = None
     start = ask_geo("Entrez un point de départ")
     addresses = []
     while True:
@@ -291,6 +909,8 @@ if __name__ == '__main__':
     # Create drone at home location
     print(start)
     drone = dronekit_wrapper.Drone(start[1][0], start[1][1], "127.0.0.1")
+    # Reconnect automatically if the link drops
+    drone.supervise()
     # Drone takeoff
     drone.arm_and_takeoff(20)
     # Mission creation, addresses assignment
@@ -302,19 +922,32 @@ if __name__ == '__main__':
 
     # Drone is going to an address
     while not drone.is_returning:
+        if not drone.link_ok:
+            # Attributes are stale until the supervisor reconnects
+            drone.wait_until(lambda: drone.link_ok)
+            continue
         print(f"\n[Target {drone.vehicle.commands.next}]\n  Distance: {drone.waypoint_distance:.1f}m\n  Altitude: {drone.location[2]:.2f}m")
-        time.sleep(1)
+        # Wake up on arrival, print status every second otherwise
+        drone.wait_until(lambda: drone.is_returning, 1)
 
     # Drone is going back to home
     while not drone.has_finished:
+        if not drone.link_ok:
+            # Attributes are stale until the supervisor reconnects
+            drone.wait_until(lambda: drone.link_ok)
+            continue
         print(f"\n[Back to Home]\n  Distance: {drone.home_distance:.1f}m\n  Altitude: {drone.location[2]:.2f}m")
-        time.sleep(1)
+        drone.wait_until(lambda: drone.has_finished, 1)
     drone.land()
 
     # Drone is landing
     while drone.location[2] > .1:
+        if not drone.link_ok:
+            # Attributes are stale until the supervisor reconnects
+            drone.wait_until(lambda: drone.link_ok)
+            continue
         print(f"\n[Back to home]\n  Distance: {drone.home_distance:.1f}m\n  Altitude: {drone.location[2]:.2f}m")
-        time.sleep(1)
+        drone.wait_until(lambda: drone.location[2] <= .1, 1)
 
     # Stopping drone
     drone.stop()
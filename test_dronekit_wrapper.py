@@ -0,0 +1,71 @@
+"""
+PROJET DRONE - Tests
+
+Check that importing dronekit_wrapper stays fast and free of side effects, and distance helpers edge cases:
+  python -m unittest test_dronekit_wrapper
+"""
+
+import json, os, subprocess, sys, unittest
+
+import dronekit_wrapper
+from benchmark import IMPORT_BUDGET
+
+# Run in a new interpreter: shell and network calls are recorded instead of being made
+IMPORT_CODE = """
+import json, os, socket, sys, time
+calls = []
+def record(name):
+    def call(*args, **kwargs):
+        calls.append([name, repr(args)])
+        raise OSError(name + " blocked during import")
+    return call
+os.system = record("os.system")
+socket.socket.connect = record("socket.connect")
+socket.create_connection = record("socket.create_connection")
+socket.getaddrinfo = record("socket.getaddrinfo")
+start = time.perf_counter()
+import dronekit_wrapper
+print(json.dumps({"time": time.perf_counter() - start, "calls": calls, "modules": sorted(sys.modules)}))
+"""
+
+
+def import_wrapper():
+    """
+    Import dronekit_wrapper in a new interpreter
+    :return: {time: seconds, calls: list<[name, args]>, modules: list<str>}
+    """
+    process = subprocess.run([sys.executable, "-c", IMPORT_CODE], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=60)
+    if process.returncode:
+        raise AssertionError(f"Import failed:\n{process.stderr}")
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+class ImportTest(unittest.TestCase):
+    def test_import_time(self):
+        # Best of a few runs, the first one may wait for the disk cache
+        durations = [import_wrapper()["time"] for _ in range(3)]
+        self.assertLess(min(durations), IMPORT_BUDGET, f"Import times: {durations}")
+
+    def test_import_side_effects(self):
+        report = import_wrapper()
+        self.assertEqual(report["calls"], [])
+        # Heavy dependencies are loaded on first use only
+        for module in ("dronekit", "dronekit_sitl", "requests", "numpy"):
+            self.assertNotIn(module, report["modules"])
+
+
+class DistanceTest(unittest.TestCase):
+    def test_empty_points(self):
+        # Missions without waypoints
+        self.assertEqual(dronekit_wrapper.path_length([]), 0.)
+        self.assertEqual(len(dronekit_wrapper.path_length([], cumulative=True)), 0)
+        self.assertEqual(len(dronekit_wrapper.distances([47.27, -1.50], [])), 0)
+        self.assertEqual(dronekit_wrapper.distance_matrix([]).shape, (0, 0))
+
+    def test_single_point(self):
+        self.assertEqual(dronekit_wrapper.path_length([[47.27, -1.50]]), 0.)
+        self.assertEqual(list(dronekit_wrapper.path_length([[47.27, -1.50]], cumulative=True)), [0.])
+
+
+if __name__ == '__main__':
+    unittest.main()